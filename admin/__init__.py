@@ -1,15 +1,26 @@
+from contextlib import asynccontextmanager
 from os import environ
 
 from starlette.applications import Starlette
 from starlette.middleware import Middleware
 from starlette.middleware.sessions import SessionMiddleware
 from starlette.middleware.cors import CORSMiddleware
-from starlette_gino.middleware import DatabaseMiddleware
 
-from admin.models import db
+from admin.audit_logs import start_audit_log_dispatcher, stop_audit_log_dispatcher
+from admin.cache import start_invalidation_listener, stop_invalidation_listener
+from admin.clicks import start_click_flusher, stop_click_flusher
+from admin.database import connect_database, disconnect_database
+from admin.fast_path import RedirectFastPath
+from admin.http_client import close_http_client, get_http_client
+from admin.metrics_middleware import RouteMetricsMiddleware
 from admin.route_manager import create_route_map
 
+routes = create_route_map()
+
 middleware = [
+    # Redirects skip everything below, including the route metrics middleware
+    Middleware(RedirectFastPath, routes=routes),
+    Middleware(RouteMetricsMiddleware),
     Middleware(SessionMiddleware, secret_key=environ.get("SECRET_KEY")),
     Middleware(
         CORSMiddleware,
@@ -21,13 +32,31 @@ middleware = [
             "Authorization",
             "Content-Type"
         ],
+        expose_headers=[
+            "X-Next-Cursor"
+        ],
         allow_methods=["*"]
-    ),
-    Middleware(
-        DatabaseMiddleware,
-        db=db,
-        database_url=environ.get("DATABASE_URL")
     )
 ]
 
-app = Starlette(routes=create_route_map(), middleware=middleware)
+
+@asynccontextmanager
+async def lifespan(app):
+    await connect_database()
+
+    await start_invalidation_listener()
+    start_click_flusher()
+    get_http_client()
+    start_audit_log_dispatcher()
+
+    try:
+        yield
+    finally:
+        await stop_click_flusher()
+        await stop_invalidation_listener()
+        await stop_audit_log_dispatcher()
+        await close_http_client()
+        await disconnect_database()
+
+
+app = Starlette(routes=routes, middleware=middleware, lifespan=lifespan)
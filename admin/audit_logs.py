@@ -1,18 +1,116 @@
 import asyncio
+import logging
+import math
+from datetime import timedelta
 from os import environ
 from enum import Enum
-from typing import Any, Dict, Optional
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 
 import httpx
 
+from admin.http_client import get_http_client
+from admin.metrics import AUDIT_LOGS_DROPPED
+from admin.models import AuditOutboxEntry, db
+from admin.ratelimits import acquire, record_response, retry_after
+
+log = logging.getLogger(__name__)
+
 WEBHOOK_URL = environ.get("AUDIT_LOG_WEBHOOK")
 
+# Discord accepts up to 10 embeds per webhook message, totalling 6000 characters
+EMBEDS_PER_MESSAGE = 10
+MESSAGE_CHARACTER_LIMIT = 6000
+FIELD_CHARACTER_LIMIT = 1024
+
+# How long to wait for more audit logs to arrive before sending a message
+AUDIT_LOG_BATCH_DELAY = float(environ.get("AUDIT_LOG_BATCH_DELAY", 1))
+
+# How often every worker checks the outbox for audit logs recorded elsewhere
+AUDIT_LOG_POLL_INTERVAL = float(environ.get("AUDIT_LOG_POLL_INTERVAL", 5))
+
+AUDIT_LOG_MAX_ATTEMPTS = int(environ.get("AUDIT_LOG_MAX_ATTEMPTS", 5))
+
+# Claimed audit logs are left alone by other dispatchers for this long, and
+# retried after it if they still haven't been delivered. The lease is renewed
+# before every attempt to send them, so it only needs to outlast one attempt.
+AUDIT_OUTBOX_LEASE = timedelta(seconds=float(environ.get("AUDIT_OUTBOX_LEASE", 60)))
+
+# Audit logs are given up on after being claimed this many times
+AUDIT_OUTBOX_MAX_CLAIMS = int(environ.get("AUDIT_OUTBOX_MAX_CLAIMS", 10))
+
+# How long shutdown keeps delivering audit logs for
+AUDIT_LOG_DRAIN_TIMEOUT = float(environ.get("AUDIT_LOG_DRAIN_TIMEOUT", 10))
+
+_outbox_written = asyncio.Event()
+
+_dispatcher_task: Optional[asyncio.Task] = None
+
+class Delivery(Enum):
+    DELIVERED = "delivered"
+    # Discord refused the message, sending it again won't help
+    REJECTED = "rejected"
+    # The message may still be delivered by trying again later
+    FAILED = "failed"
+    # Another dispatcher claimed the message while it was being delivered
+    LOST = "lost"
+
 class AuditColour(Enum):
     DEFAULT = 0xE70B71
     SUCCESS = 0x43B581
     ERROR = 0xF04747
     BLURPLE = 0x7289DA
 
+def _field_value(value: Any) -> Any:
+    # Discord rejects embeds with blank field values, like links without notes
+    if value is None or not str(value).strip():
+        return "*None*"
+
+    return value
+
+def build_embed(
+    title: Optional[str] = None,
+    body: Optional[str] = None,
+    inline_fields: Optional[Dict[str, Any]] = {},
+    newline_fields: Optional[Dict[str, Any]] = {},
+    colour: AuditColour = AuditColour.DEFAULT
+) -> dict:
+    """
+    Build the Discord embed for an audit log.
+    """
+    inline_fields = [
+        {"name": k, "value": _field_value(v), "inline": True} for k, v in inline_fields.items()
+    ]
+    newline_fields = [
+        {"name": k, "value": _field_value(v), "inline": False} for k, v in newline_fields.items()
+    ]
+
+    return {
+        "title": title,
+        "description": body,
+        "fields": inline_fields + newline_fields,
+        "color": colour.value
+    }
+
+def summarize_list(items: List[str], separator: str = ", ") -> str:
+    """
+    Join items for an embed field, ending with how many were left out if
+    they don't all fit.
+    """
+    summary = ""
+
+    for index, item in enumerate(items):
+        remaining = len(items) - index
+        candidate = f"{summary}{separator if summary else ''}{item}"
+        suffix = f" and {remaining - 1} more" if remaining > 1 else ""
+
+        if len(candidate) + len(suffix) > FIELD_CHARACTER_LIMIT:
+            return f"{summary} and {remaining} more" if summary else f"{remaining} items"
+
+        summary = candidate
+
+    return summary or "*None*"
+
 async def send_audit_log(
     title: Optional[str] = None,
     body: Optional[str] = None,
@@ -21,34 +119,246 @@ async def send_audit_log(
     colour: AuditColour = AuditColour.DEFAULT
 ):
     """
-    Send an audit log to the Discord webhook.
+    Record an audit log in the outbox to be sent to the Discord webhook.
+
+    The audit log is written on the current connection, so when called
+    inside a transaction it is only sent if the transaction commits.
+    """
+    if WEBHOOK_URL is None:
+        return
+
+    await AuditOutboxEntry.create(
+        embed=build_embed(title, body, inline_fields, newline_fields, colour)
+    )
+
+    _outbox_written.set()
+
+def _embed_size(embed: dict) -> int:
+    return sum(
+        len(str(text or ""))
+        for text in [
+            embed["title"],
+            embed["description"],
+            *(field["name"] for field in embed["fields"]),
+            *(field["value"] for field in embed["fields"])
+        ]
+    )
+
+def _pack_messages(entries: List[AuditOutboxEntry]) -> List[List[AuditOutboxEntry]]:
+    messages = []
+    size = 0
+
+    for entry in entries:
+        entry_size = _embed_size(entry.embed)
+
+        if (
+            not messages
+            or len(messages[-1]) == EMBEDS_PER_MESSAGE
+            or size + entry_size > MESSAGE_CHARACTER_LIMIT
+        ):
+            messages.append([])
+            size = 0
+
+        messages[-1].append(entry)
+        size += entry_size
+
+    return messages
+
+async def deliver_embeds(
+    embeds: List[dict],
+    renew_lease: Optional[Callable[[], Awaitable[bool]]] = None
+) -> Delivery:
+    """
+    Post embeds to the audit log webhook as a single message.
+
+    Rate limits are waited out and server errors retried with exponential
+    backoff. renew_lease is awaited right before every attempt, and if it
+    returns False the message is given up on as lost. Returns whether the
+    message was delivered, rejected or should be retried later.
     """
-    inline_fields = [{"name": k, "value": v, "inline": True} for k, v in inline_fields.items()]
-    newline_fields = [{"name": k, "value": v, "inline": False} for k, v in newline_fields.items()]
+    for attempt in range(AUDIT_LOG_MAX_ATTEMPTS):
+        await acquire("webhook", use_global=False, budget=math.inf)
+
+        if renew_lease is not None and not await renew_lease():
+            return Delivery.LOST
 
-    fields = inline_fields + newline_fields
+        try:
+            resp = await get_http_client().post(WEBHOOK_URL, json={
+                "username": "Modcast Podcast Admin",
+                "avatar_url": "https://cdn.discordapp.com/team-icons/755212236242288640/69496a2e8be6eccfee1fbc0fce476ae8.png",
+                "embeds": embeds
+            })
+        except httpx.HTTPError:
+            log.warning("Failed to reach the audit log webhook", exc_info=True)
+            await asyncio.sleep(2 ** attempt)
+            continue
 
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(WEBHOOK_URL, json={
-            "username": "Modcast Podcast Admin",
-            "avatar_url": "https://cdn.discordapp.com/team-icons/755212236242288640/69496a2e8be6eccfee1fbc0fce476ae8.png",
-            "embeds": [{
-                "title": title,
-                "description": body,
-                "fields": fields,
-                "color": colour.value
-            }]
-        })
+        await record_response("webhook", resp, use_global=False)
 
-        if resp.status_code == 204:
-            # Success
-            return
+        if resp.is_success:
+            return Delivery.DELIVERED
         elif resp.status_code == 429:
-            # Ratelimited
-            ratelimit = await resp.json()
-            
-            try_after = ratelimit["retry_after"]
-            await asyncio.sleep(try_after)
+            # Ratelimited, acquire() waits for the bucket to reset
+            log.info("Audit log webhook ratelimited for %ss", retry_after(resp))
+        elif resp.status_code >= 500:
+            await asyncio.sleep(2 ** attempt)
         else:
-            # Unknown error
-            return
+            # Retrying a request Discord rejected won't help
+            log.error("Audit log webhook rejected message: %s", resp.text)
+            return Delivery.REJECTED
+
+    return Delivery.FAILED
+
+async def _claim_outbox_entries(limit: int) -> List[AuditOutboxEntry]:
+    claimable = db.select([AuditOutboxEntry.id]).where(db.or_(
+        AuditOutboxEntry.locked_until.is_(None),
+        AuditOutboxEntry.locked_until < db.func.now()
+    )).order_by(
+        AuditOutboxEntry.id
+    ).limit(limit).with_for_update(skip_locked=True)
+
+    return await AuditOutboxEntry.update.values(
+        locked_until=db.func.now() + AUDIT_OUTBOX_LEASE,
+        attempts=AuditOutboxEntry.attempts + 1
+    ).where(
+        AuditOutboxEntry.id.in_(claimable)
+    ).returning(
+        *AuditOutboxEntry.__table__.columns
+    ).gino.load(AuditOutboxEntry).all()
+
+def _claimed(entries: List[AuditOutboxEntry]):
+    # A claim increments attempts, so this only matches entries that no
+    # other dispatcher has claimed since
+    return db.tuple_(AuditOutboxEntry.id, AuditOutboxEntry.attempts).in_(
+        [(entry.id, entry.attempts) for entry in entries]
+    )
+
+async def _renew_lease(entries: List[AuditOutboxEntry]) -> bool:
+    renewed = await AuditOutboxEntry.update.values(
+        locked_until=db.func.now() + AUDIT_OUTBOX_LEASE
+    ).where(
+        _claimed(entries)
+    ).returning(
+        AuditOutboxEntry.id
+    ).gino.all()
+
+    return len(renewed) == len(entries)
+
+async def _release_outbox_entries(entries: List[AuditOutboxEntry]):
+    await AuditOutboxEntry.update.values(
+        locked_until=None,
+        attempts=AuditOutboxEntry.attempts - 1
+    ).where(
+        _claimed(entries)
+    ).gino.status()
+
+async def dispatch_audit_outbox() -> int:
+    """
+    Claim a message's worth of undelivered audit logs and send them to the
+    webhook.
+
+    Claims are leased rather than held in a transaction, so any number of
+    workers and replicas can dispatch at once. The lease is renewed before
+    every attempt to send the message and the attempt is abandoned if it was
+    lost, so an audit log is only sent again if an attempt to send it failed
+    or timed out. Returns how many audit logs were claimed.
+    """
+    entries = await _claim_outbox_entries(EMBEDS_PER_MESSAGE)
+
+    if not entries:
+        return 0
+
+    message, *unsent = _pack_messages(entries)
+
+    # Those that didn't fit in the message are left to the next claim
+    if unsent:
+        await _release_outbox_entries([entry for rest in unsent for entry in rest])
+
+    delivery = await deliver_embeds(
+        [entry.embed for entry in message], partial(_renew_lease, message)
+    )
+
+    if delivery is Delivery.REJECTED and len(message) > 1:
+        # A single invalid embed gets the whole message rejected, so send
+        # them one at a time to only lose that one
+        deliveries = [
+            await deliver_embeds([entry.embed], partial(_renew_lease, [entry]))
+            for entry in message
+        ]
+    else:
+        deliveries = [delivery] * len(message)
+
+    finished = []
+    dropped = 0
+
+    for entry, delivery in zip(message, deliveries):
+        if delivery is Delivery.DELIVERED:
+            finished.append(entry)
+        elif delivery is Delivery.REJECTED or (
+            delivery is Delivery.FAILED and entry.attempts >= AUDIT_OUTBOX_MAX_CLAIMS
+        ):
+            finished.append(entry)
+            dropped += 1
+        # Otherwise it is left to be claimed again once the lease runs out, or
+        # to the dispatcher that claimed it since
+
+    if dropped:
+        AUDIT_LOGS_DROPPED.inc(dropped)
+        log.error("Giving up on delivering %d audit logs", dropped)
+
+    if finished:
+        await AuditOutboxEntry.delete.where(_claimed(finished)).gino.status()
+
+    return len(message)
+
+async def _dispatch_audit_logs():
+    while True:
+        try:
+            await asyncio.wait_for(_outbox_written.wait(), AUDIT_LOG_POLL_INTERVAL)
+            # Give the transaction that wrote it time to commit and let any
+            # other audit logs in the same burst join the message.
+            await asyncio.sleep(AUDIT_LOG_BATCH_DELAY)
+        except asyncio.TimeoutError:
+            pass
+
+        _outbox_written.clear()
+
+        try:
+            await _drain_audit_outbox()
+        except Exception:
+            log.exception("Failed to dispatch audit logs")
+
+async def _drain_audit_outbox():
+    while await dispatch_audit_outbox():
+        pass
+
+def start_audit_log_dispatcher():
+    global _dispatcher_task
+
+    if WEBHOOK_URL is None:
+        return
+
+    _dispatcher_task = asyncio.create_task(_dispatch_audit_logs())
+
+async def stop_audit_log_dispatcher():
+    """
+    Stop the dispatcher, delivering what is in the outbox for a short while.
+    """
+    global _dispatcher_task
+
+    if _dispatcher_task is None:
+        return
+
+    _dispatcher_task.cancel()
+    try:
+        await _dispatcher_task
+    except asyncio.CancelledError:
+        pass
+    _dispatcher_task = None
+
+    try:
+        await asyncio.wait_for(_drain_audit_outbox(), AUDIT_LOG_DRAIN_TIMEOUT)
+    except asyncio.TimeoutError:
+        log.warning("Stopped delivering audit logs, the rest stay in the outbox")
+    except Exception:
+        log.exception("Failed to dispatch audit logs")
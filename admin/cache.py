@@ -0,0 +1,289 @@
+"""
+In-process caches shared by the request handlers of a single worker.
+
+Caches registered here can be invalidated across every uvicorn worker (and
+every replica) through Postgres LISTEN/NOTIFY.
+"""
+
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+from os import environ
+from time import monotonic
+from typing import Any, Dict, Hashable, Optional, Protocol, TypeVar
+
+import asyncpg
+
+from admin.models import db
+
+log = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "admin_cache_invalidate"
+
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+MAX_PAYLOAD_SIZE = 7900
+
+# How often the listener connection is checked, and how long it gets to answer
+LISTENER_PING_INTERVAL = float(environ.get("CACHE_LISTENER_PING_INTERVAL", 30))
+LISTENER_PING_TIMEOUT = 5
+
+LISTENER_RECONNECT_MIN_DELAY = 0.5
+LISTENER_RECONNECT_MAX_DELAY = 30
+
+MISSING = object()
+
+CACHES: Dict[str, "SharedCache"] = {}
+
+_listener_connection: Optional[asyncpg.Connection] = None
+_listener_lost = asyncio.Event()
+_supervisor_task: Optional[asyncio.Task] = None
+
+
+class SharedCache(Protocol):
+    """
+    What a cache needs to be registered for invalidation across workers.
+    """
+
+    # Set while invalidations can't be received
+    bypassed: bool
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        """
+        Called when key, or anything if it is None, changed in any worker.
+        """
+
+
+C = TypeVar("C", bound=SharedCache)
+
+
+class TTLCache:
+    """
+    A size-bounded least-recently-used cache whose entries also expire.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        # Set while invalidations can't be received, making it always miss
+        self.bypassed = False
+
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        """
+        Return the cached value for key, or default if it is absent or expired.
+        """
+        if self.bypassed:
+            return default
+
+        try:
+            expires, value = self._data[key]
+        except KeyError:
+            return default
+
+        if expires < monotonic():
+            del self._data[key]
+            return default
+
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """
+        Store a value, evicting the least recently used entry when full.
+        """
+        if self.bypassed:
+            return
+
+        self._data[key] = (monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        if key is None:
+            self.clear()
+        else:
+            self.pop(key)
+
+    def __len__(self):
+        return len(self._data)
+
+
+def register_cache(name: str, cache: C) -> C:
+    """
+    Make a cache invalidatable across workers under the given name.
+    """
+    CACHES[name] = cache
+    return cache
+
+
+def _apply_invalidation(cache_name: str, key: Optional[str]):
+    cache = CACHES.get(cache_name)
+
+    if cache is not None:
+        cache.invalidate(key)
+
+
+def _invalidation_payloads(cache_name: str, keys: tuple):
+    empty_size = len(json.dumps({"cache": cache_name, "keys": []}).encode())
+
+    batch = []
+    size = empty_size
+
+    for key in keys:
+        # Each key is followed by a ", " separator
+        key_size = len(json.dumps(key).encode()) + 2
+
+        # A key that doesn't fit in a notification by itself clears the cache
+        if empty_size + key_size > MAX_PAYLOAD_SIZE:
+            key = None
+            key_size = len("null, ")
+
+        if batch and size + key_size > MAX_PAYLOAD_SIZE:
+            yield json.dumps({"cache": cache_name, "keys": batch})
+            batch = []
+            size = empty_size
+
+        batch.append(key)
+        size += key_size
+
+    if batch:
+        yield json.dumps({"cache": cache_name, "keys": batch})
+
+
+async def invalidate(cache_name: str, *keys: str):
+    """
+    Drop keys from a registered cache in this worker and notify all others.
+
+    Keys are batched into as few notifications as fit. They are sent on the
+    current connection, so when called inside a transaction the other
+    workers only hear about them once it commits.
+    """
+    for key in keys:
+        _apply_invalidation(cache_name, key)
+
+    for payload in _invalidation_payloads(cache_name, keys):
+        await db.scalar(db.select([
+            db.func.pg_notify(INVALIDATION_CHANNEL, payload)
+        ]))
+
+
+def _on_notification(_connection, _pid, _channel, payload):
+    try:
+        message = json.loads(payload)
+
+        for key in message["keys"]:
+            _apply_invalidation(message["cache"], key)
+    except (ValueError, KeyError, TypeError):
+        log.warning("Ignoring malformed cache invalidation: %r", payload)
+
+
+def _set_caches_bypassed(bypassed: bool):
+    # Whichever way, what was cached can't be trusted: either we can no longer
+    # hear about changes made by other workers, or we just missed some.
+    for cache in CACHES.values():
+        cache.bypassed = bypassed
+        cache.invalidate()
+
+
+def _on_listener_terminated(_connection):
+    global _listener_connection
+    _listener_connection = None
+
+    log.warning("Lost the cache invalidation listener, bypassing caches until it reconnects")
+
+    _set_caches_bypassed(True)
+    _listener_lost.set()
+
+
+async def _connect_listener():
+    global _listener_connection
+
+    connection = await asyncpg.connect(environ.get("DATABASE_URL"))
+    connection.add_termination_listener(_on_listener_terminated)
+
+    await connection.add_listener(INVALIDATION_CHANNEL, _on_notification)
+
+    _listener_connection = connection
+    _set_caches_bypassed(False)
+
+
+async def _is_listener_alive() -> bool:
+    try:
+        await asyncio.wait_for(_listener_connection.fetchval("SELECT 1"), LISTENER_PING_TIMEOUT)
+    except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError):
+        return False
+
+    return True
+
+
+async def _supervise_listener():
+    while True:
+        try:
+            await asyncio.wait_for(_listener_lost.wait(), LISTENER_PING_INTERVAL)
+        except asyncio.TimeoutError:
+            # A connection that silently went away is only noticed on use
+            if _listener_connection is not None and not await _is_listener_alive():
+                _listener_connection.terminate()
+
+            continue
+
+        _listener_lost.clear()
+
+        delay = LISTENER_RECONNECT_MIN_DELAY
+
+        while True:
+            await asyncio.sleep(delay)
+
+            try:
+                await _connect_listener()
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError):
+                log.warning("Failed to reconnect the cache invalidation listener", exc_info=True)
+                delay = min(delay * 2, LISTENER_RECONNECT_MAX_DELAY)
+            else:
+                log.info("Reconnected the cache invalidation listener")
+                break
+
+
+async def start_invalidation_listener():
+    """
+    Open a dedicated connection listening for invalidations from other workers,
+    and keep it open.
+
+    While it is disconnected registered caches are bypassed, since they would
+    miss invalidations.
+    """
+    global _supervisor_task
+
+    await _connect_listener()
+
+    _supervisor_task = asyncio.create_task(_supervise_listener())
+
+
+async def stop_invalidation_listener():
+    global _listener_connection, _supervisor_task
+
+    if _supervisor_task is not None:
+        _supervisor_task.cancel()
+
+        try:
+            await _supervisor_task
+        except asyncio.CancelledError:
+            pass
+
+        _supervisor_task = None
+
+    if _listener_connection is not None:
+        connection, _listener_connection = _listener_connection, None
+        connection.remove_termination_listener(_on_listener_terminated)
+        await connection.close()
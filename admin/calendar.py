@@ -1,8 +1,18 @@
-from datetime import datetime
+import asyncio
+import heapq
+from datetime import date, datetime, timedelta
+from email.utils import formatdate
+from hashlib import sha256
+from itertools import count, repeat
+from os import environ
+from typing import Iterable, Iterator, NamedTuple, Optional, Tuple
 
+from dateutil.relativedelta import relativedelta
 from icalendar import Calendar, Event, vDate
 
-from admin.models import CalendarEvent, RepeatConfiguration
+from admin.cache import MISSING, TTLCache, invalidate, register_cache
+from admin.database import mark_written, read_bind
+from admin.models import CalendarEvent, RepeatConfiguration, db
 
 FREQUENCIES = {
     RepeatConfiguration.ONCE: None,
@@ -11,11 +21,125 @@ FREQUENCIES = {
     RepeatConfiguration.MONTHLY: {"FREQ": "WEEKLY", "INTERVAL": "1"}
 }
 
+DAYS = {
+    RepeatConfiguration.WEEKLY: 7,
+    RepeatConfiguration.FORTNIGHTLY: 14
+}
+
+# The feed is regenerated whenever an event changes, the TTL is only a
+# safety net in case an invalidation is ever missed.
+ICAL_CACHE = register_cache("ical", TTLCache(
+    maxsize=1,
+    ttl=float(environ.get("ICAL_CACHE_TTL", 3600))
+))
+
+# Records the feed's ETag, keeping when it was first seen unless it changed,
+# so that every worker serves the same Last-Modified for the same feed
+RECORD_FEED_VERSION_QUERY = db.text(
+    "INSERT INTO ical_feed_state (id, etag, last_modified) "
+    "VALUES (1, :etag, now()) "
+    "ON CONFLICT (id) DO UPDATE SET "
+    "etag = EXCLUDED.etag, "
+    "last_modified = CASE "
+    "WHEN ical_feed_state.etag = EXCLUDED.etag THEN ical_feed_state.last_modified "
+    "ELSE EXCLUDED.last_modified "
+    "END "
+    "RETURNING last_modified"
+)
+
+_regenerate_lock = asyncio.Lock()
+
+
+class ICalFeed(NamedTuple):
+    """
+    A serialized iCal feed along with its HTTP validators.
+    """
+    body: bytes
+    etag: str
+    last_modified: str
+
+
+def occurrence_date(event: CalendarEvent, index: int) -> date:
+    """
+    Return the date of the index-th occurrence of an event, counting from 0.
+    """
+    if event.repeat_configuration in DAYS:
+        return event.first_date + timedelta(days=DAYS[event.repeat_configuration] * index)
+
+    # Always offset from the first date so that events on the 31st don't
+    # drift once they have been clamped to a shorter month.
+    return event.first_date + relativedelta(months=index)
+
+
+def first_occurrence_index(event: CalendarEvent, start: date) -> int:
+    """
+    Return the index of the first occurrence of an event on or after start.
+    """
+    if event.repeat_configuration in DAYS:
+        interval = DAYS[event.repeat_configuration]
+        return max(0, -(-(start - event.first_date).days // interval))
+
+    index = max(
+        0,
+        (start.year - event.first_date.year) * 12 + start.month - event.first_date.month
+    )
+
+    if occurrence_date(event, index) < start:
+        index += 1
+
+    return index
+
+
+def iter_occurrences(
+    event: CalendarEvent,
+    start: date,
+    end: Optional[date] = None
+) -> Iterator[date]:
+    """
+    Lazily yield the dates an event occurs on between start and end inclusive.
+    """
+    if event.repeat_configuration is RepeatConfiguration.ONCE:
+        if start <= event.first_date and (end is None or event.first_date <= end):
+            yield event.first_date
+        return
+
+    try:
+        first_index = first_occurrence_index(event, start)
+    except (OverflowError, ValueError):
+        # The event doesn't occur again before date.max
+        return
 
-async def generate_ical():
-    calendar_events = await CalendarEvent.query.order_by(
-        CalendarEvent.first_date
-    ).gino.all()
+    for index in count(first_index):
+        try:
+            day = occurrence_date(event, index)
+        except (OverflowError, ValueError):
+            return
+
+        if end is not None and day > end:
+            return
+
+        yield day
+
+
+def merge_occurrences(
+    events: Iterable[CalendarEvent],
+    start: date,
+    end: Optional[date] = None
+) -> Iterator[Tuple[date, CalendarEvent]]:
+    """
+    Lazily yield (date, event) for every occurrence of the given events between
+    start and end inclusive, in date order.
+    """
+    return heapq.merge(
+        *(zip(iter_occurrences(event, start, end), repeat(event)) for event in events),
+        key=lambda occurrence: occurrence[0]
+    )
+
+
+async def generate_ical(bind):
+    calendar_events = await bind.all(
+        CalendarEvent.query.order_by(CalendarEvent.first_date)
+    )
 
     calendar = Calendar()
 
@@ -42,3 +166,42 @@ async def generate_ical():
         calendar.add_component(ev)
 
     return calendar.to_ical()
+
+
+async def get_ical_feed() -> ICalFeed:
+    """
+    Return the cached iCal feed, regenerating it if events have changed.
+    """
+    feed = ICAL_CACHE.get("feed")
+
+    if feed is MISSING:
+        async with _regenerate_lock:
+            # Another request may have regenerated it while we waited
+            feed = ICAL_CACHE.get("feed")
+
+            if feed is MISSING:
+                body = await generate_ical(read_bind("ical"))
+                etag = f'"{sha256(body).hexdigest()}"'
+
+                # Don't move Last-Modified forward if nothing actually changed
+                last_modified = await db.scalar(RECORD_FEED_VERSION_QUERY, etag=etag)
+
+                feed = ICalFeed(
+                    body=body,
+                    etag=etag,
+                    last_modified=formatdate(last_modified.timestamp(), usegmt=True)
+                )
+
+                ICAL_CACHE.set("feed", feed)
+
+    return feed
+
+
+async def invalidate_ical_feed():
+    """
+    Make every worker regenerate the iCal feed on its next request.
+    """
+    await invalidate("ical", "feed")
+
+    # Regenerating from the replica could cache the feed from before the change
+    await mark_written("ical")
@@ -0,0 +1,206 @@
+"""
+Write-behind click counting for short URLs.
+
+Redirects only bump in-memory counters per short code and hour, and per
+short code, day and dimension value, which are periodically written to the
+database in one transaction: a single batched UPDATE of the link totals and
+a single upsert each of the hourly click stats and daily dimension rollups.
+"""
+
+import asyncio
+import logging
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from os import environ
+from time import time
+from typing import Optional
+
+from admin.models import db
+
+log = logging.getLogger(__name__)
+
+CLICK_FLUSH_INTERVAL = float(environ.get("CLICK_FLUSH_INTERVAL", 5))
+CLICK_FLUSH_THRESHOLD = int(environ.get("CLICK_FLUSH_THRESHOLD", 1000))
+
+# Dimension values are client controlled, so once this many distinct
+# counters are pending any new values are counted as "other" instead.
+DIMENSION_MAX_PENDING = int(environ.get("DIMENSION_MAX_PENDING", 50000))
+
+EPOCH = date(1970, 1, 1)
+
+FLUSH_CLICKS_QUERY = db.text(
+    "UPDATE short_urls SET clicks = short_urls.clicks + pending.delta "
+    "FROM unnest(CAST(:short_codes AS text[]), CAST(:deltas AS integer[])) "
+    "AS pending (short_code, delta) "
+    "WHERE short_urls.short_code = pending.short_code"
+)
+
+# Joined against short_urls so that clicks on links deleted or renamed since
+# they were counted are dropped rather than failing the whole flush.
+FLUSH_CLICK_STATS_QUERY = db.text(
+    "INSERT INTO click_stats (short_code, bucket, clicks) "
+    "SELECT pending.short_code, pending.bucket, pending.clicks "
+    "FROM unnest("
+    "CAST(:short_codes AS text[]), "
+    "CAST(:buckets AS timestamp[]), "
+    "CAST(:clicks AS integer[])"
+    ") AS pending (short_code, bucket, clicks) "
+    "JOIN short_urls ON short_urls.short_code = pending.short_code "
+    "ON CONFLICT (short_code, bucket) "
+    "DO UPDATE SET clicks = click_stats.clicks + EXCLUDED.clicks"
+)
+
+FLUSH_DIMENSIONS_QUERY = db.text(
+    "INSERT INTO click_dimensions (short_code, day, dimension, value, clicks) "
+    "SELECT pending.short_code, pending.day, pending.dimension, pending.value, pending.clicks "
+    "FROM unnest("
+    "CAST(:short_codes AS text[]), "
+    "CAST(:days AS date[]), "
+    "CAST(:dimensions AS text[]), "
+    "CAST(:dimension_values AS text[]), "
+    "CAST(:clicks AS integer[])"
+    ") AS pending (short_code, day, dimension, value, clicks) "
+    "JOIN short_urls ON short_urls.short_code = pending.short_code "
+    "ON CONFLICT (short_code, day, dimension, value) "
+    "DO UPDATE SET clicks = click_dimensions.clicks + EXCLUDED.clicks"
+)
+
+# Keyed by (short code, hours since the epoch)
+PENDING_CLICKS = Counter()
+
+# Keyed by (short code, days since the epoch, dimension, value)
+PENDING_DIMENSIONS = Counter()
+
+_pending_total = 0
+_flush_requested = asyncio.Event()
+_flush_task: Optional[asyncio.Task] = None
+
+
+def record_click(short_code: str):
+    """
+    Count a click against a short code without touching the database.
+    """
+    global _pending_total
+
+    PENDING_CLICKS[short_code, int(time() // 3600)] += 1
+    _pending_total += 1
+
+    if _pending_total >= CLICK_FLUSH_THRESHOLD:
+        _flush_requested.set()
+
+
+def record_dimensions(short_code: str, **dimensions: Optional[str]):
+    """
+    Count a redirect against the given dimension values of a short code.
+
+    Dimensions with a value of None are skipped.
+    """
+    day = int(time() // 86400)
+
+    for dimension, value in dimensions.items():
+        if value is None:
+            continue
+
+        key = (short_code, day, dimension, value)
+
+        if key not in PENDING_DIMENSIONS and len(PENDING_DIMENSIONS) >= DIMENSION_MAX_PENDING:
+            key = (short_code, day, dimension, "other")
+
+        PENDING_DIMENSIONS[key] += 1
+
+
+async def flush_clicks():
+    """
+    Write all pending clicks to the database.
+    """
+    global PENDING_CLICKS, PENDING_DIMENSIONS, _pending_total
+
+    if not PENDING_CLICKS and not PENDING_DIMENSIONS:
+        return
+
+    pending, PENDING_CLICKS = PENDING_CLICKS, Counter()
+    pending_dimensions, PENDING_DIMENSIONS = PENDING_DIMENSIONS, Counter()
+    _pending_total = 0
+
+    # Keep the order rows are locked in stable between workers flushing at
+    # the same time.
+    buckets = sorted(pending)
+
+    totals = Counter()
+    for (short_code, _hour), clicks in pending.items():
+        totals[short_code] += clicks
+
+    short_codes = sorted(totals)
+
+    rollups = sorted(pending_dimensions)
+
+    try:
+        async with db.transaction():
+            await db.status(
+                FLUSH_CLICKS_QUERY,
+                short_codes=short_codes,
+                deltas=[totals[short_code] for short_code in short_codes]
+            )
+
+            await db.status(
+                FLUSH_CLICK_STATS_QUERY,
+                short_codes=[short_code for short_code, _hour in buckets],
+                buckets=[
+                    datetime.fromtimestamp(hour * 3600, timezone.utc).replace(tzinfo=None)
+                    for _short_code, hour in buckets
+                ],
+                clicks=[pending[bucket] for bucket in buckets]
+            )
+
+            await db.status(
+                FLUSH_DIMENSIONS_QUERY,
+                short_codes=[rollup[0] for rollup in rollups],
+                days=[EPOCH + timedelta(days=rollup[1]) for rollup in rollups],
+                dimensions=[rollup[2] for rollup in rollups],
+                dimension_values=[rollup[3] for rollup in rollups],
+                clicks=[pending_dimensions[rollup] for rollup in rollups]
+            )
+    except Exception:
+        # Put the clicks back so they go out with the next flush
+        PENDING_CLICKS.update(pending)
+        PENDING_DIMENSIONS.update(pending_dimensions)
+        _pending_total += sum(pending.values())
+        raise
+
+
+async def _flush_periodically():
+    while True:
+        try:
+            await asyncio.wait_for(_flush_requested.wait(), CLICK_FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+        _flush_requested.clear()
+
+        try:
+            await flush_clicks()
+        except Exception:
+            log.exception("Failed to flush %d pending clicks", _pending_total)
+
+
+def start_click_flusher():
+    global _flush_task
+
+    _flush_task = asyncio.create_task(_flush_periodically())
+
+
+async def stop_click_flusher():
+    """
+    Stop the periodic flush and write out whatever is still pending.
+    """
+    global _flush_task
+
+    if _flush_task is not None:
+        _flush_task.cancel()
+        try:
+            await _flush_task
+        except asyncio.CancelledError:
+            pass
+        _flush_task = None
+
+    await flush_clicks()
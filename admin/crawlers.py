@@ -0,0 +1,64 @@
+"""
+Process-wide crawler detection for User-Agent strings.
+"""
+
+from functools import lru_cache
+from os import environ
+
+from crawlerdetect import CrawlerDetect
+
+# Building a detector loads and compiles the full pattern list, so it is only
+# ever done once per worker.
+CRAWLER_DETECTOR = CrawlerDetect()
+
+# User-Agents are sent by clients without any limit on their length, so only
+# this much of each is looked at and kept in the caches below
+MAX_USER_AGENT_LENGTH = 512
+
+
+def is_crawler(user_agent: str) -> bool:
+    """
+    Return whether a User-Agent belongs to a crawler.
+
+    Requests without a User-Agent at all are treated as automated.
+    """
+    return _is_crawler(user_agent[:MAX_USER_AGENT_LENGTH])
+
+
+@lru_cache(maxsize=int(environ.get("CRAWLER_VERDICT_CACHE_SIZE", 4096)))
+def _is_crawler(user_agent: str) -> bool:
+    if not user_agent or user_agent.isspace():
+        return True
+
+    return CRAWLER_DETECTOR.isCrawler(user_agent)
+
+
+# Checked in order, the first family with a matching token wins. Most
+# browsers claim to be several others, so the more specific ones come first.
+UA_FAMILIES = (
+    ("edge", ("Edg/", "Edge/")),
+    ("opera", ("OPR/", "Opera")),
+    ("samsung", ("SamsungBrowser/",)),
+    ("chrome", ("Chrome/", "CriOS/")),
+    ("firefox", ("Firefox/", "FxiOS/")),
+    ("safari", ("Safari/",)),
+)
+
+
+def ua_family(user_agent: str) -> str:
+    """
+    Classify a User-Agent into a coarse browser family, or "crawler".
+    """
+    return _ua_family(user_agent[:MAX_USER_AGENT_LENGTH])
+
+
+@lru_cache(maxsize=int(environ.get("CRAWLER_VERDICT_CACHE_SIZE", 4096)))
+def _ua_family(user_agent: str) -> str:
+    if _is_crawler(user_agent):
+        return "crawler"
+
+    for family, tokens in UA_FAMILIES:
+        if any(token in user_agent for token in tokens):
+            return family
+
+    return "other"
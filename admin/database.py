@@ -0,0 +1,214 @@
+"""
+Binding the GINO engines to Postgres and instrumenting their connection pools.
+
+Requests don't hold a connection of their own: Route.dispatch opens a lazy
+one around the handler, which is only checked out of the pool by the first
+query and is returned as soon as the handler does.
+
+If DATABASE_REPLICA_URL is set, read-only handlers read through read_bind(),
+which returns a second engine bound to the replica unless whatever is being
+read was written recently, in which case the replica may not have caught up
+yet and the primary is read from instead.
+"""
+
+import asyncio
+from os import environ
+from time import monotonic, perf_counter
+from typing import Optional
+
+import gino
+from gino.dialects.asyncpg import Pool
+from gino.engine import GinoEngine
+
+from admin.cache import MISSING, TTLCache, invalidate, register_cache
+from admin.metrics import (
+    DB_POOL_ACQUIRE_DURATION, DB_POOL_ACQUIRE_TIMEOUTS, DB_POOL_ACQUIRES_WAITING,
+    DB_POOL_CONNECTIONS, DB_POOL_CONNECTIONS_IN_USE, DB_POOL_MAX_CONNECTIONS,
+    instrument_database
+)
+from admin.models import db
+from admin.utils import hash_api_key
+
+# Per worker and per engine, so the most connections open at once to each
+# database is this times the workers
+DB_POOL_MAX_SIZE = int(environ.get("DB_POOL_MAX_SIZE", 10))
+DB_POOL_MIN_SIZE = int(environ.get("DB_POOL_MIN_SIZE", min(10, DB_POOL_MAX_SIZE)))
+
+# Seconds to wait for a free connection before giving up
+DB_POOL_TIMEOUT = float(environ.get("DB_POOL_TIMEOUT", 10))
+
+DATABASE_REPLICA_URL = environ.get("DATABASE_REPLICA_URL")
+
+# Seconds after a write during which it is read back from the primary, this
+# should comfortably exceed the replication lag
+REPLICA_STICKINESS = float(environ.get("DATABASE_REPLICA_STICKINESS", 10))
+
+replica: Optional[GinoEngine] = None
+
+
+class InstrumentedPool(Pool):
+    """
+    asyncpg pool for GINO that applies DB_POOL_TIMEOUT to every acquire and
+    keeps the pool metrics up to date.
+    """
+    name = "primary"
+
+    async def _init(self):
+        pool = await super()._init()
+
+        self._max_connections = DB_POOL_MAX_CONNECTIONS.labels(self.name)
+        self._connections = DB_POOL_CONNECTIONS.labels(self.name)
+        self._in_use = DB_POOL_CONNECTIONS_IN_USE.labels(self.name)
+        self._waiting = DB_POOL_ACQUIRES_WAITING.labels(self.name)
+        self._acquire_duration = DB_POOL_ACQUIRE_DURATION.labels(self.name)
+        self._acquire_timeouts = DB_POOL_ACQUIRE_TIMEOUTS.labels(self.name)
+
+        self._max_connections.inc(self._pool.get_max_size())
+        self._connections.set(self._pool.get_size())
+
+        return pool
+
+    async def acquire(self, *, timeout=None):
+        self._waiting.inc()
+        started = perf_counter()
+
+        try:
+            conn = await super().acquire(
+                timeout=DB_POOL_TIMEOUT if timeout is None else timeout
+            )
+        except asyncio.TimeoutError:
+            self._acquire_timeouts.inc()
+            raise
+        finally:
+            self._waiting.dec()
+            self._acquire_duration.observe(perf_counter() - started)
+
+        self._in_use.inc()
+        self._connections.set(self._pool.get_size())
+
+        return conn
+
+    async def release(self, conn):
+        try:
+            await super().release(conn)
+        finally:
+            self._in_use.dec()
+            self._connections.set(self._pool.get_size())
+
+    async def close(self):
+        await super().close()
+
+        self._max_connections.dec(self._pool.get_max_size())
+        self._connections.set(0)
+
+
+class ReplicaPool(InstrumentedPool):
+    name = "replica"
+
+
+class RecentWrites:
+    """
+    Names of what was written in the last REPLICA_STICKINESS seconds.
+
+    It is registered as a cache so that invalidating a name marks it as
+    written in every worker. Invalidating everything, as happens when the
+    invalidation listener is lost or reconnects, marks everything as written,
+    as does bypassing it while the listener is disconnected.
+    """
+
+    def __init__(self, maxsize: int, window: float):
+        self.window = window
+        self.bypassed = False
+
+        self._writes = TTLCache(maxsize=maxsize, ttl=window)
+        self._everything_until = 0.0
+
+    def invalidate(self, name: Optional[str] = None):
+        if name is None:
+            self._writes.clear()
+            self._everything_until = monotonic() + self.window
+        else:
+            self._writes.set(name, True)
+
+    def __contains__(self, name: str) -> bool:
+        return (
+            self.bypassed
+            or monotonic() < self._everything_until
+            or self._writes.get(name) is not MISSING
+        )
+
+
+RECENT_WRITES = register_cache("recent_writes", RecentWrites(
+    maxsize=int(environ.get("RECENT_WRITES_CACHE_SIZE", 10000)),
+    window=REPLICA_STICKINESS
+))
+
+
+def read_bind(*names: str) -> GinoEngine:
+    """
+    Return the engine to read with, the replica unless there is none or any
+    of the names was written recently.
+
+    Names are written_by() API keys, short codes and the like. They don't need to be
+    unique across kinds, a clash only sends some reads to the primary.
+    """
+    if replica is None or any(name in RECENT_WRITES for name in names):
+        return db.bind
+
+    return replica
+
+
+def written_by(api_key: str) -> str:
+    """
+    Return the name under which an API key's writes are marked, a hash so
+    that keys are never sent in invalidation payloads.
+    """
+    return "api_key:" + hash_api_key(api_key)
+
+
+async def mark_written(*names: str):
+    """
+    Read the names from the primary in every worker for a while.
+
+    Like invalidate(), when called inside a transaction the other workers
+    only hear about it once it commits.
+    """
+    if replica is not None:
+        await invalidate("recent_writes", *names)
+
+
+async def connect_database():
+    """
+    Bind the GINO engine to DATABASE_URL, and create the replica's engine if
+    DATABASE_REPLICA_URL is set, both with instrumented pools.
+    """
+    global replica
+
+    await db.set_bind(
+        environ.get("DATABASE_URL"),
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        pool_class=InstrumentedPool
+    )
+
+    instrument_database(db.bind)
+
+    if DATABASE_REPLICA_URL:
+        replica = await gino.create_engine(
+            DATABASE_REPLICA_URL,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            pool_class=ReplicaPool
+        )
+
+        instrument_database(replica)
+
+
+async def disconnect_database():
+    global replica
+
+    if replica is not None:
+        engine, replica = replica, None
+        await engine.close()
+
+    await db.pop_bind().close()
@@ -0,0 +1,70 @@
+"""
+Extraction of the dimensions redirects are broken down by.
+
+Countries are only resolved when the optional geoip2 package is installed
+and GEOIP_DATABASE points at a GeoLite2/GeoIP2 country database file. They
+are resolved from the client address uvicorn reports, so behind a proxy it
+must be run with --forwarded-allow-ips covering the proxy, as the Dockerfile
+does for the ingress.
+"""
+
+from functools import lru_cache
+from os import environ
+from typing import Optional
+from urllib.parse import urlsplit
+
+try:
+    import geoip2.database
+    import geoip2.errors
+except ImportError:
+    geoip2 = None
+
+GEOIP_DATABASE = environ.get("GEOIP_DATABASE")
+
+MAX_VALUE_LENGTH = 255
+
+_geoip_reader = None
+
+
+def referrer_host(referrer: Optional[str]) -> str:
+    """
+    Return the host of a Referer header, or "direct" if there isn't one.
+    """
+    if not referrer:
+        return "direct"
+
+    try:
+        host = urlsplit(referrer).hostname
+    except ValueError:
+        host = None
+
+    return (host or "unknown")[:MAX_VALUE_LENGTH]
+
+
+def _get_geoip_reader():
+    global _geoip_reader
+
+    if _geoip_reader is None and geoip2 is not None and GEOIP_DATABASE:
+        _geoip_reader = geoip2.database.Reader(GEOIP_DATABASE)
+
+    return _geoip_reader
+
+
+@lru_cache(maxsize=4096)
+def lookup_country(ip_address: Optional[str]) -> Optional[str]:
+    """
+    Return the ISO country code of an IP address.
+
+    Returns None when country lookups are not configured, and "unknown" when
+    the address isn't in the database.
+    """
+    if (reader := _get_geoip_reader()) is None:
+        return None
+
+    if not ip_address:
+        return "unknown"
+
+    try:
+        return reader.country(ip_address).country.iso_code or "unknown"
+    except (geoip2.errors.AddressNotFoundError, ValueError):
+        return "unknown"
@@ -1,41 +1,127 @@
-from collections import defaultdict
+import asyncio
+from functools import partial
 from os import environ
+from time import monotonic
 
-import httpx
+from admin.cache import MISSING, TTLCache
+from admin.http_client import get_http_client
+from admin.ratelimits import acquire, bucket_remaining, record_response, retry_after
+from admin.utils import RateLimitException
 
 DISCORD_API_TOKEN = environ.get("BOT_TOKEN")
 
-RATELIMITS = defaultdict(dict)
+# Users are served from cache for USER_CACHE_FRESH_TTL seconds, after which
+# they are still served but refreshed in the background, until they are
+# dropped entirely after USER_CACHE_TTL seconds.
+USER_CACHE_FRESH_TTL = float(environ.get("USER_CACHE_FRESH_TTL", 3600))
 
-USER_CACHE = {}
+USER_CACHE = TTLCache(
+    maxsize=int(environ.get("USER_CACHE_SIZE", 2048)),
+    ttl=float(environ.get("USER_CACHE_TTL", 86400))
+)
 
-DISCORD_API_BASE = "https://discord.com/api/v7"
+# Upper bound on concurrent upstream lookups made for one batch of users
+USER_BATCH_CONCURRENCY = int(environ.get("USER_BATCH_CONCURRENCY", 5))
+
+# Upstream lookups currently running, so concurrent requests for the same
+# user share a single request to Discord.
+IN_FLIGHT = {}
 
-class RateLimitException(Exception):
-    pass
+DISCORD_API_BASE = "https://discord.com/api/v7"
 
 async def upstream_get_user(user_id):
-    if RATELIMITS["users"].get("remaining") == 0:
-        raise RateLimitException(RATELIMITS["users"]["reset_after"])
+    await acquire("users")
 
-    async with httpx.AsyncClient() as client:
-        user = await client.get(f"{DISCORD_API_BASE}/users/{user_id}", headers={
-            "Authorization": f"Bot {DISCORD_API_TOKEN}"
-        })
+    user = await get_http_client().get(f"{DISCORD_API_BASE}/users/{user_id}", headers={
+        "Authorization": f"Bot {DISCORD_API_TOKEN}"
+    })
 
-    RATELIMITS["users"]["reset_after"] = user.headers["x-ratelimit-reset-after"]
-    RATELIMITS["users"]["remaining"] = user.headers["x-ratelimit-remaining"]
+    await record_response("users", user)
 
     if user.status_code == 429:
         # R A T E L I M I T S !
-        raise RateLimitException(RATELIMITS["users"]["reset_after"])
+        raise RateLimitException(retry_after(user))
     else:
         user_data = user.json()
-        USER_CACHE[user_data["id"]] = user_data
+        USER_CACHE.set(user_data["id"], (monotonic(), user_data))
         return user_data, user.status_code
 
+def _lookup_finished(user_id, task):
+    IN_FLIGHT.pop(user_id, None)
+
+    # Background refreshes have nobody waiting on them, so mark any failure
+    # as handled. The stale entry is simply served until the next attempt.
+    if not task.cancelled():
+        task.exception()
+
+def start_user_lookup(user_id):
+    """
+    Start an upstream lookup of a user, or return the one already running.
+    """
+    user_id = str(user_id)
+
+    if (task := IN_FLIGHT.get(user_id)) is None:
+        task = asyncio.ensure_future(upstream_get_user(user_id))
+        task.add_done_callback(partial(_lookup_finished, user_id))
+        IN_FLIGHT[user_id] = task
+
+    return task
+
+async def coalesced_get_user(user_id):
+    # Shielded so that one caller going away doesn't cancel the lookup for
+    # everyone else waiting on it.
+    return await asyncio.shield(start_user_lookup(user_id))
+
 async def get_user(user_id):
-    if user := USER_CACHE.get(str(user_id)):
-        return user, 200
-    else:
-        return await upstream_get_user(user_id)
\ No newline at end of file
+    cached = USER_CACHE.get(str(user_id))
+
+    if cached is MISSING:
+        return await coalesced_get_user(user_id)
+
+    fetched_at, user = cached
+
+    if monotonic() - fetched_at > USER_CACHE_FRESH_TTL:
+        start_user_lookup(user_id)
+
+    return user, 200
+
+async def get_users(user_ids):
+    """
+    Resolve many users at once.
+
+    Cached users are returned straight away, the rest are looked up
+    concurrently without spending more requests than the users rate limit
+    bucket has left. Returns the users found, the ids Discord doesn't know
+    and a mapping of rate limited ids to when they can be retried.
+    """
+    users = {}
+    not_found = []
+    ratelimited = {}
+
+    misses = []
+
+    for user_id in map(str, user_ids):
+        if USER_CACHE.get(user_id) is MISSING:
+            misses.append(user_id)
+        else:
+            users[user_id], _ = await get_user(user_id)
+
+    concurrency = USER_BATCH_CONCURRENCY
+
+    if (remaining := await bucket_remaining("users")) is not None:
+        concurrency = max(1, min(concurrency, remaining))
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def resolve(user_id):
+        async with semaphore:
+            try:
+                users[user_id], _ = await coalesced_get_user(user_id)
+            except RateLimitException as e:
+                ratelimited[user_id] = e.args[0]
+            except KeyError:
+                not_found.append(user_id)
+
+    await asyncio.gather(*map(resolve, misses))
+
+    return users, not_found, ratelimited
@@ -0,0 +1,112 @@
+"""
+ASGI fast path serving short URL redirects ahead of the rest of the app.
+"""
+
+from time import perf_counter
+from urllib.parse import quote
+
+from starlette.routing import Mount
+
+from admin.clicks import record_click, record_dimensions
+from admin.crawlers import is_crawler, ua_family
+from admin.dimensions import lookup_country, referrer_host
+from admin.metrics import REQUEST_STATS, RequestStats, observe_request
+from admin.redirect_cache import resolve_short_code
+from admin.routes.short_url import ShortURLRedirect
+
+# The characters RedirectResponse leaves unquoted in the Location header
+LOCATION_SAFE = ":/%#?=@[]!$&'()*+,;"
+
+NOT_FOUND_BODY = b"Short code not found"
+
+
+def reserved_paths(routes) -> set:
+    """
+    Return the single segment paths handled by routes other than the redirect.
+    """
+    paths = set()
+
+    for route in routes:
+        if isinstance(route, Mount):
+            paths.add(route.path)
+        elif "{" not in route.path:
+            paths.add(route.path)
+
+    return paths
+
+
+class RedirectFastPath:
+    """
+    Answers GET and HEAD requests for single segment paths straight from the
+    redirect cache, without the session and CORS middleware or the
+    router. Everything else is passed on to the app.
+
+    It behaves like ShortURLRedirect, which still serves redirects if this is
+    not installed, and records metrics under the same route name.
+    """
+
+    def __init__(self, app, routes):
+        self.app = app
+        self.reserved = reserved_paths(routes)
+
+    def is_redirect(self, scope) -> bool:
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            return False
+
+        path = scope["path"]
+
+        return len(path) > 1 and "/" not in path[1:] and path not in self.reserved
+
+    async def __call__(self, scope, receive, send):
+        if not self.is_redirect(scope):
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = REQUEST_STATS.set(stats)
+
+        status = 500
+        started = perf_counter()
+
+        try:
+            short_code = scope["path"][1:]
+            long_url = await resolve_short_code(short_code)
+
+            if long_url:
+                headers = dict(scope["headers"])
+                user_agent = headers.get(b"user-agent", b"").decode("latin-1")
+                referrer = headers.get(b"referer")
+                client = scope.get("client")
+
+                if not is_crawler(user_agent):
+                    record_click(short_code)
+
+                record_dimensions(
+                    short_code,
+                    referrer=referrer_host(referrer.decode("latin-1") if referrer else None),
+                    ua_family=ua_family(user_agent),
+                    country=lookup_country(client[0] if client else None)
+                )
+
+                status = 307
+                response_headers = [
+                    (b"location", quote(long_url, safe=LOCATION_SAFE).encode("latin-1")),
+                    (b"content-length", b"0")
+                ]
+                body = b""
+            else:
+                status = 404
+                response_headers = [
+                    (b"content-type", b"text/plain; charset=utf-8"),
+                    (b"content-length", str(len(NOT_FOUND_BODY)).encode("latin-1"))
+                ]
+                body = NOT_FOUND_BODY
+
+            await send({"type": "http.response.start", "status": status, "headers": response_headers})
+            await send({"type": "http.response.body", "body": body})
+        finally:
+            REQUEST_STATS.reset(token)
+
+            observe_request(
+                ShortURLRedirect.name, scope["method"], status, perf_counter() - started, stats
+            )
@@ -0,0 +1,82 @@
+"""
+The application-wide HTTP client used for all outbound requests.
+
+Sharing a single client per worker lets requests to Discord reuse pooled
+keep-alive connections rather than paying for a new TCP and TLS handshake
+on every call.
+"""
+
+from functools import partial
+from os import environ
+from time import perf_counter
+from typing import Optional
+
+import httpx
+
+from admin.metrics import (
+    HTTP_CLIENT_CONNECTIONS, HTTP_CLIENT_REQUEST_DURATION, HTTP_CLIENT_REQUESTS, REQUEST_STATS
+)
+
+HTTP_TIMEOUT = httpx.Timeout(
+    float(environ.get("HTTP_TIMEOUT", 10)),
+    connect=float(environ.get("HTTP_CONNECT_TIMEOUT", 5)),
+    pool=float(environ.get("HTTP_POOL_TIMEOUT", 5))
+)
+
+HTTP_LIMITS = httpx.Limits(
+    max_connections=int(environ.get("HTTP_MAX_CONNECTIONS", 20)),
+    max_keepalive_connections=int(environ.get("HTTP_MAX_KEEPALIVE_CONNECTIONS", 10)),
+    keepalive_expiry=float(environ.get("HTTP_KEEPALIVE_EXPIRY", 60))
+)
+
+# Requests to these hosts count as Discord calls of the request being handled
+DISCORD_HOSTS = {"discord.com", "discordapp.com"}
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+async def _trace_connections(host: str, event_name: str, _info: dict):
+    if event_name == "connection.connect_tcp.complete":
+        HTTP_CLIENT_CONNECTIONS.labels(host).inc()
+
+
+async def _count_request(request: httpx.Request):
+    HTTP_CLIENT_REQUESTS.labels(request.url.host).inc()
+    request.extensions["trace"] = partial(_trace_connections, request.url.host)
+    request.extensions["started_at"] = perf_counter()
+
+    if request.url.host in DISCORD_HOSTS and (stats := REQUEST_STATS.get()) is not None:
+        stats.discord_calls += 1
+
+
+async def _time_response(response: httpx.Response):
+    request = response.request
+
+    HTTP_CLIENT_REQUEST_DURATION.labels(request.url.host, response.status_code).observe(
+        perf_counter() - request.extensions["started_at"]
+    )
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Return the shared HTTP client, creating it if it isn't open yet.
+    """
+    global _client
+
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=True,
+            timeout=HTTP_TIMEOUT,
+            limits=HTTP_LIMITS,
+            event_hooks={"request": [_count_request], "response": [_time_response]}
+        )
+
+    return _client
+
+
+async def close_http_client():
+    global _client
+
+    if _client is not None:
+        client, _client = _client, None
+        await client.aclose()
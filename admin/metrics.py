@@ -0,0 +1,199 @@
+"""
+Prometheus metrics collected by the application.
+
+When PROMETHEUS_MULTIPROC_DIR is set, as it is when running several uvicorn
+workers, every worker writes its metrics there and /metrics aggregates them.
+"""
+
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Dict, Optional, Tuple
+
+from gino.dialects.asyncpg import DBAPICursor
+from prometheus_client import Counter, Gauge, Histogram
+
+HTTP_CLIENT_REQUESTS = Counter(
+    "http_client_requests_total",
+    "Outbound HTTP requests sent through the shared client.",
+    ["host"]
+)
+
+HTTP_CLIENT_CONNECTIONS = Counter(
+    "http_client_connections_opened_total",
+    "New outbound connections opened by the shared client, "
+    "any request beyond these reused a pooled connection.",
+    ["host"]
+)
+
+HTTP_CLIENT_REQUEST_DURATION = Histogram(
+    "http_client_request_duration_seconds",
+    "Time until the response headers of outbound HTTP requests arrived.",
+    ["host", "status"]
+)
+
+AUDIT_LOGS_DROPPED = Counter(
+    "audit_logs_dropped_total",
+    "Audit logs that were discarded without being delivered to the webhook."
+)
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total",
+    "Requests handled, by route name, method and response status.",
+    ["route", "method", "status"]
+)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time taken to handle a request, including streaming the response body.",
+    ["route", "method"]
+)
+
+HTTP_REQUEST_DB_QUERIES = Histogram(
+    "http_request_db_queries",
+    "Database queries made while handling a request.",
+    ["route", "method"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100)
+)
+
+HTTP_REQUEST_DB_DURATION = Histogram(
+    "http_request_db_duration_seconds",
+    "Time spent waiting on database queries while handling a request.",
+    ["route", "method"]
+)
+
+HTTP_REQUEST_DISCORD_CALLS = Histogram(
+    "http_request_discord_calls",
+    "Calls made to Discord while handling a request.",
+    ["route", "method"],
+    buckets=(0, 1, 2, 5, 10, 25, 50, 100)
+)
+
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Time taken by every database query, including those made in the background."
+)
+
+# Pool gauges are summed over the live workers, so they describe the whole
+# deployment's share of Postgres connections
+DB_POOL_MAX_CONNECTIONS = Gauge(
+    "db_pool_max_connections",
+    "Connections the database pools may open.",
+    ["pool"],
+    multiprocess_mode="livesum"
+)
+
+DB_POOL_CONNECTIONS = Gauge(
+    "db_pool_connections",
+    "Connections currently open in the database pools.",
+    ["pool"],
+    multiprocess_mode="livesum"
+)
+
+DB_POOL_CONNECTIONS_IN_USE = Gauge(
+    "db_pool_connections_in_use",
+    "Connections currently checked out of the database pools.",
+    ["pool"],
+    multiprocess_mode="livesum"
+)
+
+DB_POOL_ACQUIRES_WAITING = Gauge(
+    "db_pool_acquires_waiting",
+    "Callers waiting for a connection to be free in the database pools.",
+    ["pool"],
+    multiprocess_mode="livesum"
+)
+
+DB_POOL_ACQUIRE_DURATION = Histogram(
+    "db_pool_acquire_duration_seconds",
+    "Time spent waiting for a connection from the database pool.",
+    ["pool"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+
+DB_POOL_ACQUIRE_TIMEOUTS = Counter(
+    "db_pool_acquire_timeouts_total",
+    "Connections that could not be acquired from the database pool in time.",
+    ["pool"]
+)
+
+
+class RequestStats:
+    """
+    Tallies of the work done while handling a single request.
+    """
+    __slots__ = ("db_queries", "db_seconds", "discord_calls")
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.discord_calls = 0
+
+
+# The stats of the request being handled, if any, in the current context
+REQUEST_STATS: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+_route_metrics: Dict[Tuple[str, str], tuple] = {}
+_request_counters: Dict[Tuple[str, str, int], Counter] = {}
+
+
+def observe_request(route: str, method: str, status: int, seconds: float, stats: RequestStats):
+    """
+    Record a handled request against the metrics of its route.
+    """
+    # Looking up labelled metrics takes a lock, so they're cached per route
+    try:
+        duration, db_queries, db_duration, discord_calls = _route_metrics[route, method]
+    except KeyError:
+        duration, db_queries, db_duration, discord_calls = _route_metrics[route, method] = (
+            HTTP_REQUEST_DURATION.labels(route, method),
+            HTTP_REQUEST_DB_QUERIES.labels(route, method),
+            HTTP_REQUEST_DB_DURATION.labels(route, method),
+            HTTP_REQUEST_DISCORD_CALLS.labels(route, method)
+        )
+
+    try:
+        requests = _request_counters[route, method, status]
+    except KeyError:
+        requests = _request_counters[route, method, status] = HTTP_REQUESTS.labels(route, method, status)
+
+    requests.inc()
+    duration.observe(seconds)
+    db_queries.observe(stats.db_queries)
+    db_duration.observe(stats.db_seconds)
+    discord_calls.observe(stats.discord_calls)
+
+
+def _observe_query(seconds: float):
+    DB_QUERY_DURATION.observe(seconds)
+
+    if (stats := REQUEST_STATS.get()) is not None:
+        stats.db_queries += 1
+        stats.db_seconds += seconds
+
+
+class _InstrumentedCursor(DBAPICursor):
+    """
+    GINO cursor timing every statement it sends. Streamed queries are timed
+    until their statement is prepared.
+    """
+
+    async def prepare(self, *args, **kwargs):
+        started = perf_counter()
+        try:
+            return await super().prepare(*args, **kwargs)
+        finally:
+            _observe_query(perf_counter() - started)
+
+    async def async_execute(self, *args, **kwargs):
+        started = perf_counter()
+        try:
+            return await super().async_execute(*args, **kwargs)
+        finally:
+            _observe_query(perf_counter() - started)
+
+
+def instrument_database(engine):
+    """
+    Time the queries of every connection subsequently acquired from a GINO engine.
+    """
+    engine.dialect.cursor_cls = _InstrumentedCursor
@@ -0,0 +1,47 @@
+"""
+ASGI middleware recording the metrics of every request against its route.
+"""
+
+from time import perf_counter
+
+from admin.metrics import REQUEST_STATS, RequestStats, observe_request
+
+
+class RouteMetricsMiddleware:
+    """
+    Times requests and tallies the database queries and Discord calls made
+    while handling them, labelled with the name of the route that handled it.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = REQUEST_STATS.set(stats)
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+            await send(message)
+
+        started = perf_counter()
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUEST_STATS.reset(token)
+
+            # The router stores the endpoint it matched in the scope
+            route = getattr(scope.get("endpoint"), "name", None) or "unmatched"
+
+            observe_request(route, scope["method"], status, perf_counter() - started, stats)
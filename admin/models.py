@@ -2,6 +2,7 @@ from enum import Enum
 
 from datetime import datetime
 from gino import Gino
+from sqlalchemy.dialects.postgresql import JSONB
 
 db = Gino()
 
@@ -19,6 +20,52 @@ class ShortURL(db.Model):
     notes = db.Column(db.Text, default="")
     clicks = db.Column(db.Integer, nullable=False, default=0)
 
+    # Keyset pagination of the link list, overall and per creator
+    _clicks_idx = db.Index("ix_short_urls_clicks_short_code", "clicks", "short_code")
+    _creator_clicks_idx = db.Index(
+        "ix_short_urls_creator_clicks_short_code", "creator", "clicks", "short_code"
+    )
+
+
+class ClickStat(db.Model):
+    """
+    The number of clicks a short link received within an hour.
+    """
+    __tablename__ = "click_stats"
+
+    short_code = db.Column(
+        db.Text,
+        db.ForeignKey("short_urls.short_code", ondelete="CASCADE", onupdate="CASCADE"),
+        primary_key=True
+    )
+
+    # Start of the hour, in UTC
+    bucket = db.Column(db.DateTime, primary_key=True)
+
+    clicks = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ClickDimension(db.Model):
+    """
+    The number of redirects a short link received in a day with one value of
+    a dimension, such as a referrer host or country.
+    """
+    __tablename__ = "click_dimensions"
+
+    short_code = db.Column(
+        db.Text,
+        db.ForeignKey("short_urls.short_code", ondelete="CASCADE", onupdate="CASCADE"),
+        primary_key=True
+    )
+
+    day = db.Column(db.Date, primary_key=True)
+
+    dimension = db.Column(db.Text, primary_key=True)
+
+    value = db.Column(db.Text, primary_key=True)
+
+    clicks = db.Column(db.Integer, nullable=False, default=0)
+
 
 class APIKey(db.Model):
     """
@@ -84,3 +131,40 @@ class CalendarEventAssignments(db.Model):
 
     event_id = db.Column(db.String, db.ForeignKey("events.id"))
     user_id = db.Column(db.BigInteger, db.ForeignKey("api_keys.creator"))
+
+
+class AuditOutboxEntry(db.Model):
+    """
+    An audit log waiting to be delivered to the Discord webhook.
+    """
+    __tablename__ = "audit_outbox"
+
+    id = db.Column(db.BigInteger, primary_key=True)
+
+    # The Discord embed to send
+    embed = db.Column(JSONB, nullable=False)
+
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False, server_default=db.func.now())
+
+    # How many times a dispatcher has claimed this entry
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+
+    # Set while a dispatcher is delivering the entry, other dispatchers skip it until then
+    locked_until = db.Column(db.DateTime(timezone=True), nullable=True)
+
+
+class ICalFeedState(db.Model):
+    """
+    The version of the iCal feed last served by any worker, so that they all
+    agree on when it was last modified.
+    """
+    __tablename__ = "ical_feed_state"
+
+    # There is only ever the one row
+    id = db.Column(db.Integer, primary_key=True)
+
+    # The ETag of the feed
+    etag = db.Column(db.Text, nullable=False)
+
+    # When the feed first had this ETag
+    last_modified = db.Column(db.DateTime(timezone=True), nullable=False)
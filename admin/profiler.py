@@ -0,0 +1,149 @@
+"""
+On-demand sampling profiler for the current worker.
+
+Nothing here runs until a profile is requested. While one is running a
+thread samples the event loop thread's stack at a fixed interval, and a
+task on the loop measures how late its wakeups are.
+"""
+
+import asyncio
+import sys
+import threading
+from collections import Counter
+from os import environ
+from pathlib import Path
+from time import monotonic
+from types import FrameType
+from typing import List, NamedTuple
+
+# Profiles are bounded so a forgotten request can't slow a worker for long
+MAX_PROFILE_DURATION = float(environ.get("MAX_PROFILE_DURATION", 30))
+
+MIN_SAMPLE_INTERVAL = 0.001
+
+# How often the event loop lag is measured
+LAG_INTERVAL = 0.01
+
+# Deeper frames of task stacks are left out of task dumps
+TASK_STACK_LIMIT = 20
+
+_profile_lock = asyncio.Lock()
+
+
+class Profile(NamedTuple):
+    duration: float
+    samples: int
+    # Stack samples in the collapsed format of flamegraph.pl, root first
+    stacks: Counter
+    # Seconds each wakeup of the event loop came later than it should have
+    loop_lag: List[float]
+
+
+def _frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+
+def _collapse(frame: FrameType) -> str:
+    names = []
+
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+
+    return ";".join(reversed(names))
+
+
+def _sample(thread_id: int, interval: float, stop: threading.Event, stacks: Counter):
+    while not stop.wait(interval):
+        if (frame := sys._current_frames().get(thread_id)) is not None:
+            stacks[_collapse(frame)] += 1
+
+
+async def _measure_lag(lags: List[float]):
+    loop = asyncio.get_running_loop()
+
+    while True:
+        started = loop.time()
+        await asyncio.sleep(LAG_INTERVAL)
+        lags.append(max(loop.time() - started - LAG_INTERVAL, 0.0))
+
+
+def _clamp(value: float, low: float, high: float) -> float:
+    # NaN compares false with everything, so it is clamped to low rather
+    # than passed through by min() and max()
+    if not value >= low:
+        return low
+
+    return min(value, high)
+
+
+def is_profiling() -> bool:
+    return _profile_lock.locked()
+
+
+async def profile(duration: float, interval: float) -> Profile:
+    """
+    Sample the event loop thread for duration seconds, every interval seconds.
+
+    Only one profile runs at a time per worker, check is_profiling() first
+    to avoid waiting for another to finish.
+    """
+    duration = _clamp(duration, 0.0, MAX_PROFILE_DURATION)
+    interval = _clamp(interval, MIN_SAMPLE_INTERVAL, MAX_PROFILE_DURATION)
+
+    async with _profile_lock:
+        stacks = Counter()
+        lags = []
+        stop = threading.Event()
+
+        sampler = threading.Thread(
+            target=_sample,
+            args=(threading.get_ident(), interval, stop, stacks),
+            name="profiler",
+            daemon=True
+        )
+        lag_task = asyncio.create_task(_measure_lag(lags))
+
+        started = monotonic()
+        sampler.start()
+
+        try:
+            await asyncio.sleep(duration)
+        finally:
+            stop.set()
+            lag_task.cancel()
+            await asyncio.get_running_loop().run_in_executor(None, sampler.join)
+
+        return Profile(
+            duration=monotonic() - started,
+            samples=sum(stacks.values()),
+            stacks=stacks,
+            loop_lag=lags
+        )
+
+
+def dump_tasks() -> List[dict]:
+    """
+    Describe every task on the event loop and where it is suspended.
+    """
+    tasks = []
+
+    for task in asyncio.all_tasks():
+        coro = task.get_coro()
+
+        tasks.append({
+            "name": task.get_name(),
+            "coro": getattr(coro, "__qualname__", repr(coro)),
+            "done": task.done(),
+            "stack": [_frame_name(frame) for frame in task.get_stack(limit=TASK_STACK_LIMIT)]
+        })
+
+    return tasks
+
+
+def collapsed(stacks: Counter) -> str:
+    """
+    Render stack samples as collapsed stacks, one per line.
+    """
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
@@ -0,0 +1,205 @@
+"""
+Scheduling of outbound Discord API calls against Discord's rate limits.
+
+Every route we call is tracked as a token bucket alongside the global bucket
+shared by all bot requests. Callers reserve a token before each request and
+are paced until one becomes available, failing only when that would take
+longer than their wait budget.
+
+Bucket state is kept in a small file locked with flock, so that all of the
+uvicorn workers in a pod spend from the same buckets. The lock is only ever
+tried without blocking, waiting for it sleeps rather than stalling the event
+loop.
+"""
+
+import asyncio
+import fcntl
+import json
+from contextlib import asynccontextmanager
+from os import environ
+from time import monotonic, time
+from typing import Optional
+
+import httpx
+
+from admin.utils import RateLimitException
+
+RATELIMIT_STATE_PATH = environ.get(
+    "DISCORD_RATELIMIT_STATE_PATH", "/tmp/modpod-discord-ratelimits.json"
+)
+
+# How long a caller may be held back waiting for a token by default
+RATELIMIT_WAIT_BUDGET = float(environ.get("DISCORD_RATELIMIT_WAIT_BUDGET", 2))
+
+# Seconds to sleep between attempts at taking the state file's lock, doubling
+# after every attempt up to the maximum
+RATELIMIT_LOCK_RETRY_INTERVAL = 0.001
+RATELIMIT_LOCK_RETRY_MAX_INTERVAL = 0.05
+
+GLOBAL_BUCKET = "global"
+
+# Discord allows bots 50 requests per second across all routes. Webhooks
+# aren't counted against it, so they are acquired with use_global=False.
+GLOBAL_LIMIT = 50
+GLOBAL_WINDOW = 1.0
+
+
+@asynccontextmanager
+async def _bucket_state():
+    with open(RATELIMIT_STATE_PATH, "a+") as state_file:
+        delay = RATELIMIT_LOCK_RETRY_INTERVAL
+
+        while True:
+            try:
+                fcntl.flock(state_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RATELIMIT_LOCK_RETRY_MAX_INTERVAL)
+
+        state_file.seek(0)
+        try:
+            state = json.loads(state_file.read() or "{}")
+        except ValueError:
+            state = {}
+
+        yield state
+
+        state_file.seek(0)
+        state_file.truncate()
+        json.dump(state, state_file)
+
+
+def _refill(bucket: dict, now: float):
+    if bucket["reset_at"] <= now:
+        bucket["remaining"] = bucket["limit"]
+        bucket["reset_at"] = now + bucket["window"]
+
+
+async def reserve(route: str, use_global: bool = True) -> float:
+    """
+    Try to take a token for a request to route.
+
+    Returns 0 if a token was taken, otherwise how many seconds until one may
+    be available.
+    """
+    now = time()
+
+    async with _bucket_state() as state:
+        buckets = [state.get(route)]
+
+        if use_global:
+            buckets.append(state.setdefault(GLOBAL_BUCKET, {
+                "limit": GLOBAL_LIMIT,
+                "remaining": GLOBAL_LIMIT,
+                "reset_at": now + GLOBAL_WINDOW,
+                "window": GLOBAL_WINDOW
+            }))
+
+        buckets = [bucket for bucket in buckets if bucket is not None]
+
+        for bucket in buckets:
+            _refill(bucket, now)
+
+        wait = max(
+            (bucket["reset_at"] - now for bucket in buckets if bucket["remaining"] <= 0),
+            default=0.0
+        )
+
+        if wait <= 0:
+            for bucket in buckets:
+                bucket["remaining"] -= 1
+
+        return wait
+
+
+async def acquire(route: str, use_global: bool = True, budget: Optional[float] = None):
+    """
+    Wait until a request to route may be made.
+
+    Raises RateLimitException with the expected wait if it would exceed the
+    budget.
+    """
+    deadline = monotonic() + (RATELIMIT_WAIT_BUDGET if budget is None else budget)
+
+    while (wait := await reserve(route, use_global)) > 0:
+        if monotonic() + wait > deadline:
+            raise RateLimitException(round(wait, 3))
+
+        await asyncio.sleep(wait)
+
+
+def retry_after(response: httpx.Response) -> float:
+    """
+    Return how long Discord asked us to wait after a response, in seconds.
+    """
+    for header in ("x-ratelimit-reset-after", "retry-after"):
+        try:
+            return float(response.headers[header])
+        except (KeyError, ValueError):
+            continue
+
+    return 1.0
+
+
+async def record_response(route: str, response: httpx.Response, use_global: bool = True):
+    """
+    Update the buckets for route from the rate limit headers of a response.
+
+    use_global should match what route is acquired with, without it a global
+    rate limit only holds back route.
+    """
+    now = time()
+    headers = response.headers
+
+    async with _bucket_state() as state:
+        if response.status_code == 429 and headers.get("x-ratelimit-global") and use_global:
+            global_bucket = state.get(GLOBAL_BUCKET)
+
+            if global_bucket is not None:
+                global_bucket["remaining"] = 0
+                global_bucket["reset_at"] = now + retry_after(response)
+
+            return
+
+        try:
+            limit = int(headers["x-ratelimit-limit"])
+            remaining = int(headers["x-ratelimit-remaining"])
+            reset_after = float(headers["x-ratelimit-reset-after"])
+        except (KeyError, ValueError):
+            if response.status_code == 429:
+                state[route] = {
+                    "limit": 1,
+                    "remaining": 0,
+                    "reset_at": now + retry_after(response),
+                    "window": retry_after(response)
+                }
+            return
+
+        bucket = state.get(route)
+
+        # Requests reserved by other workers may not have been counted by
+        # Discord yet, so never trust a higher count for the current window.
+        if bucket is not None and bucket["reset_at"] > now:
+            remaining = min(remaining, bucket["remaining"])
+
+        state[route] = {
+            "limit": limit,
+            "remaining": 0 if response.status_code == 429 else remaining,
+            "reset_at": now + reset_after,
+            "window": max(reset_after, bucket["window"] if bucket else 0)
+        }
+
+
+async def bucket_remaining(route: str) -> Optional[int]:
+    """
+    Return how many requests are left for route, if its bucket is known.
+    """
+    now = time()
+
+    async with _bucket_state() as state:
+        if (bucket := state.get(route)) is None:
+            return None
+
+        _refill(bucket, now)
+        return bucket["remaining"]
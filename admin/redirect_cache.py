@@ -0,0 +1,59 @@
+"""
+Cache of short code to long URL resolutions for the redirect route.
+"""
+
+from os import environ
+from typing import Optional
+
+from admin.cache import MISSING, TTLCache, invalidate, register_cache
+from admin.database import mark_written, read_bind
+from admin.models import ShortURL
+
+REDIRECT_CACHE = register_cache("short_urls", TTLCache(
+    maxsize=int(environ.get("REDIRECT_CACHE_SIZE", 10000)),
+    ttl=float(environ.get("REDIRECT_CACHE_TTL", 300))
+))
+
+# Unknown short codes are cached too so that scanners hitting random paths
+# don't each cost a query, but only briefly and apart from the real links so
+# that they can't evict them.
+NOT_FOUND_CACHE = register_cache("short_urls_not_found", TTLCache(
+    maxsize=int(environ.get("REDIRECT_CACHE_NOT_FOUND_SIZE", 1024)),
+    ttl=float(environ.get("REDIRECT_CACHE_NOT_FOUND_TTL", 30))
+))
+
+# Longer unknown short codes aren't worth the memory of remembering
+NOT_FOUND_MAX_LENGTH = 256
+
+
+async def resolve_short_code(short_code: str) -> Optional[str]:
+    """
+    Return the long URL for a short code, or None if it does not exist.
+    """
+    long_url = REDIRECT_CACHE.get(short_code)
+
+    if long_url is MISSING:
+        if NOT_FOUND_CACHE.get(short_code) is not MISSING:
+            return None
+
+        long_url = await read_bind(short_code).scalar(
+            ShortURL.select("long_url").where(ShortURL.short_code == short_code)
+        )
+
+        if long_url is not None:
+            REDIRECT_CACHE.set(short_code, long_url)
+        elif len(short_code) <= NOT_FOUND_MAX_LENGTH:
+            NOT_FOUND_CACHE.set(short_code, None)
+
+    return long_url
+
+
+async def invalidate_short_codes(*short_codes: str):
+    """
+    Forget the cached resolution of short codes in every worker.
+    """
+    await invalidate("short_urls", *short_codes)
+    await invalidate("short_urls_not_found", *short_codes)
+
+    # Otherwise the next miss could cache what the replica still has
+    await mark_written(*short_codes)
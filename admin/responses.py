@@ -0,0 +1,146 @@
+"""
+Response classes shared between routes.
+"""
+
+import csv
+import io
+import json
+from typing import Any, Callable, List
+
+from starlette.responses import StreamingResponse
+
+from admin.models import db
+
+# Encoded rows are buffered up to roughly this many bytes before being sent
+CHUNK_SIZE = 64 * 1024
+
+
+def _encode_json(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+async def _encode_rows(
+    query,
+    encode: Callable[[Any], str],
+    head: str = "",
+    separator: str = "",
+    tail: str = "",
+    bind=None
+):
+    # Rows are read from the primary unless another engine, like the
+    # replica, is passed
+    bind = bind or db.bind
+
+    # Server-side cursors only live as long as the transaction around them
+    async with bind.transaction():
+        buffer = [head]
+        buffered = len(head)
+        next_separator = ""
+
+        async for row in bind.iterate(query):
+            encoded = next_separator + encode(row)
+            next_separator = separator
+
+            buffer.append(encoded)
+            buffered += len(encoded)
+
+            if buffered >= CHUNK_SIZE:
+                yield "".join(buffer).encode("utf-8")
+                buffer.clear()
+                buffered = 0
+
+        buffer.append(tail)
+        yield "".join(buffer).encode("utf-8")
+
+
+class StreamingJSONResponse(StreamingResponse):
+    """
+    Stream the rows of a query as a JSON array, serializing each row as it is
+    read from a server-side cursor so memory use does not grow with the result.
+    """
+
+    def __init__(
+        self,
+        query,
+        serialize: Callable[[Any], Any],
+        status_code: int = 200,
+        headers: dict = None,
+        background=None,
+        bind=None
+    ):
+        super().__init__(
+            _encode_rows(
+                query,
+                lambda row: _encode_json(serialize(row)),
+                head="[",
+                separator=",",
+                tail="]",
+                bind=bind
+            ),
+            status_code=status_code,
+            headers=headers,
+            media_type="application/json",
+            background=background
+        )
+
+
+class StreamingNDJSONResponse(StreamingResponse):
+    """
+    Stream the rows of a query as newline delimited JSON objects.
+    """
+
+    def __init__(
+        self,
+        query,
+        serialize: Callable[[Any], Any],
+        status_code: int = 200,
+        headers: dict = None,
+        background=None,
+        bind=None
+    ):
+        super().__init__(
+            _encode_rows(query, lambda row: _encode_json(serialize(row)) + "\n", bind=bind),
+            status_code=status_code,
+            headers=headers,
+            media_type="application/x-ndjson",
+            background=background
+        )
+
+
+class StreamingCSVResponse(StreamingResponse):
+    """
+    Stream the rows of a query as CSV with a header row of the given fields,
+    taken from the dictionaries rows are serialized to.
+    """
+
+    def __init__(
+        self,
+        query,
+        serialize: Callable[[Any], dict],
+        fields: List[str],
+        status_code: int = 200,
+        headers: dict = None,
+        background=None,
+        bind=None
+    ):
+        line = io.StringIO()
+        writer = csv.DictWriter(line, fields, extrasaction="ignore")
+
+        def encode(row: dict) -> str:
+            line.seek(0)
+            line.truncate()
+            writer.writerow(row)
+            return line.getvalue()
+
+        super().__init__(
+            _encode_rows(
+                query,
+                lambda row: encode(serialize(row)),
+                head=encode(dict(zip(fields, fields))),
+                bind=bind
+            ),
+            status_code=status_code,
+            headers=headers,
+            media_type="text/csv",
+            background=background
+        )
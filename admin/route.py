@@ -1,13 +1,58 @@
+from contextlib import AsyncExitStack
+
 from starlette.endpoints import HTTPEndpoint
+from starlette.requests import Request
+
+from admin.database import mark_written, written_by
+from admin.models import db
+
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
 
 class Route(HTTPEndpoint):
     name: str = None
     path: str = None
 
+    # Whether the handler's queries share one lazily acquired connection. Routes
+    # that keep requests open long after querying should not hold on to one.
+    share_connection: bool = True
+
     @classmethod
     def check_parameters(cls):
         if cls.name is None:
             raise ValueError(f"Route {cls.__name__} has not defined a name")
 
         if cls.path is None:
-            raise ValueError(f"Route {cls.__name__} has not defined a path")
\ No newline at end of file
+            raise ValueError(f"Route {cls.__name__} has not defined a path")
+
+    async def dispatch(self):
+        request = Request(self.scope, receive=self.receive)
+        send = self.send
+
+        # The connection is only checked out if the handler queries the
+        # database, and goes back to the pool before the response is sent.
+        # HTTPEndpoint.dispatch() sends the response as soon as the handler
+        # returns it, so the connection is released when it starts sending.
+        connection = AsyncExitStack()
+
+        async def release_connection():
+            # Let the key read back what it may have just written from the
+            # primary, rather than from a replica that is yet to replay it
+            api_key = getattr(request.state, "api_key", None)
+
+            if request.method not in READ_METHODS and api_key is not None:
+                await mark_written(written_by(api_key.key))
+
+            await connection.aclose()
+
+        async def send_after_release(message):
+            if message["type"] == "http.response.start":
+                await release_connection()
+
+            await send(message)
+
+        async with connection:
+            if self.share_connection:
+                await connection.enter_async_context(db.acquire(lazy=True))
+
+            self.send = send_after_release
+            await super().dispatch()
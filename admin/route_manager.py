@@ -14,7 +14,10 @@ from admin.route import Route
 
 def construct_route_map_from_dict(route_dict: dict):
     route_map = []
-    for mount, item in route_dict.items():
+
+    # Routes are matched in order, so fixed paths like /metrics must come
+    # before paths with parameters like /{short_code:str} that would match them.
+    for mount, item in sorted(route_dict.items(), key=lambda entry: "{" in entry[0]):
         if inspect.isclass(item):
             route_map.append(StarletteRoute(mount, item))
         else:
@@ -0,0 +1,73 @@
+import math
+import os
+from statistics import mean
+
+from starlette.responses import JSONResponse, PlainTextResponse
+
+from admin.profiler import collapsed, dump_tasks, is_profiling, profile
+from admin.route import Route
+from admin.utils import is_admin, is_authorized
+
+
+class ProfileRoute(Route):
+    """
+    Route for profiling the worker that handles the request.
+    """
+    name = "profile"
+    path = "/profile"
+
+    # Otherwise a connection checked out to look up the API key would be held
+    # for the whole profile
+    share_connection = False
+
+    @is_authorized
+    @is_admin
+    async def get(self, request):
+        """
+        Sample the worker for the given duration, returning the collapsed
+        stacks as text with format=collapsed, or otherwise as JSON along with
+        event loop lag stats and a dump of the tasks running when it ended.
+        """
+        try:
+            duration = float(request.query_params.get("duration", 5))
+            interval = float(request.query_params.get("interval", 0.005))
+        except ValueError:
+            return JSONResponse({
+                "status": "error",
+                "message": "duration and interval must be numbers of seconds"
+            }, status_code=400)
+
+        if not all(math.isfinite(value) and value > 0 for value in (duration, interval)):
+            return JSONResponse({
+                "status": "error",
+                "message": "duration and interval must be positive and finite"
+            }, status_code=400)
+
+        if is_profiling():
+            return JSONResponse({
+                "status": "error",
+                "message": "This worker is already being profiled"
+            }, status_code=409)
+
+        result = await profile(duration, interval)
+
+        if request.query_params.get("format") == "collapsed":
+            return PlainTextResponse(collapsed(result.stacks), headers={
+                "X-Worker-PID": str(os.getpid())
+            })
+
+        lags = sorted(result.loop_lag)
+
+        return JSONResponse({
+            "pid": os.getpid(),
+            "duration": result.duration,
+            "samples": result.samples,
+            "loop_lag": {
+                "measurements": len(lags),
+                "mean": mean(lags) if lags else None,
+                "p99": lags[int(len(lags) * 0.99)] if lags else None,
+                "max": lags[-1] if lags else None
+            },
+            "tasks": dump_tasks(),
+            "collapsed": collapsed(result.stacks)
+        })
@@ -1,8 +1,19 @@
-from starlette.responses import JSONResponse
-
+from admin.database import read_bind, written_by
 from admin.route import Route
 from admin.models import APIKey
-from admin.utils import is_admin, is_authorized, is_json
+from admin.responses import StreamingJSONResponse
+from admin.utils import is_admin, is_authorized
+
+
+def serialize_token(token: APIKey) -> dict:
+    """
+    Serialize an API key without a user attached for the API.
+    """
+    token_data = token.__dict__["__values__"]
+
+    token_data.pop("creator")
+
+    return token_data
 
 
 class AdminUserRoute(Route):
@@ -15,19 +26,12 @@ class AdminUserRoute(Route):
     @is_authorized
     @is_admin
     async def get(self, request):
-        users = await APIKey.query.where(
+        tokens = APIKey.query.where(
             APIKey.creator.is_(None)
         ).order_by(
             APIKey.is_admin.desc()
-        ).gino.all()
-
-        response = []
-
-        for user in users:
-            user_data = user.__dict__["__values__"]
-
-            user_data.pop("creator")
-
-            response.append(user_data)
+        )
 
-        return JSONResponse(response)
+        return StreamingJSONResponse(
+            tokens, serialize_token, bind=read_bind(written_by(request.state.api_key.key))
+        )
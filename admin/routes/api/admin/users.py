@@ -1,14 +1,26 @@
 import secrets
 
-from starlette.background import BackgroundTask
 from asyncpg.exceptions import UniqueViolationError
 from starlette.responses import JSONResponse
 
 from admin.audit_logs import send_audit_log, AuditColour
+from admin.database import read_bind, written_by
 from admin.discord_api import get_user
 from admin.route import Route
-from admin.models import APIKey
-from admin.utils import is_admin, is_authorized, is_json
+from admin.models import APIKey, db
+from admin.responses import StreamingJSONResponse
+from admin.utils import invalidate_api_keys, is_admin, is_authorized, is_json
+
+
+def serialize_user(user: APIKey) -> dict:
+    """
+    Serialize a user's API key for the API.
+    """
+    user_data = user.__dict__["__values__"]
+
+    user_data["creator"] = str(user_data["creator"])
+
+    return user_data
 
 
 class AdminUserRoute(Route):
@@ -21,22 +33,15 @@ class AdminUserRoute(Route):
     @is_authorized
     @is_admin
     async def get(self, request):
-        users = await APIKey.query.where(
+        users = APIKey.query.where(
             APIKey.creator.isnot(None)
         ).order_by(
             APIKey.is_admin.desc()
-        ).gino.all()
-
-        response = []
-
-        for user in users:
-            user_data = user.__dict__["__values__"]
-
-            user_data["creator"] = str(user_data["creator"])
-
-            response.append(user_data)
+        )
 
-        return JSONResponse(response)
+        return StreamingJSONResponse(
+            users, serialize_user, bind=read_bind(written_by(request.state.api_key.key))
+        )
 
     @is_authorized
     @is_admin
@@ -59,25 +64,26 @@ class AdminUserRoute(Route):
         )
 
         try:
-            await new_key.create()
+            async with db.transaction():
+                await new_key.create()
+                await invalidate_api_keys(new_key.key)
+
+                await send_audit_log(
+                    title="New user added",
+                    body=f"Added by <@{request.state.api_key.creator}>",
+                    inline_fields={
+                        "User": f"<@{data['creator']}>",
+                        "Administrator": data["is_admin"]
+                    },
+                    colour=AuditColour.SUCCESS
+                )
         except UniqueViolationError:
             return JSONResponse({
                 "status": "error",
                 "message": "Users can only have one API key per Discord ID"
             }, status_code=400)
 
-        task = BackgroundTask(
-            send_audit_log,
-            title="New user added",
-            body=f"Added by <@{request.state.api_key.creator}>",
-            inline_fields={
-                "User": f"<@{data['creator']}>",
-                "Administrator": data["is_admin"]
-            },
-            colour=AuditColour.SUCCESS
-        )
-
         return JSONResponse({
             "status": "success",
             "new_key": new_key.key
-        }, background=task)
+        })
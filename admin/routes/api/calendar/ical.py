@@ -1,8 +1,32 @@
+from email.utils import parsedate_to_datetime
+
 from starlette.responses import Response
 
-from admin.calendar import generate_ical
+from admin.calendar import get_ical_feed
 from admin.route import Route
-from admin.models import APIKey
+from admin.utils import get_api_key
+
+
+def etag_matches(etag: str, if_none_match: str) -> bool:
+    """
+    Check an ETag against an If-None-Match header using weak comparison.
+    """
+    if if_none_match.strip() == "*":
+        return True
+
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+
+    return etag.removeprefix("W/") in [tag.removeprefix("W/") for tag in candidates]
+
+
+def not_modified_since(last_modified: str, if_modified_since: str) -> bool:
+    """
+    Check whether a Last-Modified date is no later than If-Modified-Since.
+    """
+    try:
+        return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
 
 
 class ICalRoute(Route):
@@ -15,14 +39,28 @@ class ICalRoute(Route):
     async def get(self, request):
         authorized = False
         if token := request.query_params.get("token"):
-            if await APIKey.get(token):
+            if await get_api_key(token):
                 authorized = True
 
         if not authorized:
             return Response("Invalid token passed", status_code=403)
 
-        ical = await generate_ical()
+        feed = await get_ical_feed()
+
+        headers = {
+            "ETag": feed.etag,
+            "Last-Modified": feed.last_modified,
+            "Cache-Control": "private, no-cache"
+        }
+
+        if if_none_match := request.headers.get("If-None-Match"):
+            if etag_matches(feed.etag, if_none_match):
+                return Response(status_code=304, headers=headers)
+        elif if_modified_since := request.headers.get("If-Modified-Since"):
+            if not_modified_since(feed.last_modified, if_modified_since):
+                return Response(status_code=304, headers=headers)
 
-        return Response(ical, 200, {
-            "Content-Type": "text/calendar"
+        return Response(feed.body, 200, {
+            "Content-Type": "text/calendar",
+            **headers
         })
@@ -1,79 +1,62 @@
-from datetime import date, timedelta
+from datetime import date
+from itertools import islice
 from uuid import uuid4
-from dateutil.relativedelta import relativedelta
 
-from starlette.background import BackgroundTask
 from starlette.responses import JSONResponse
 
 from admin.audit_logs import send_audit_log, AuditColour
-from admin.models import CalendarEvent, RepeatConfiguration
+from admin.calendar import invalidate_ical_feed, merge_occurrences
+from admin.database import read_bind, written_by
+from admin.models import CalendarEvent, RepeatConfiguration, db
 from admin.route import Route
 from admin.utils import is_authorized, is_json
 
-ITERATE_COUNT = 100
-
-DAYS = {
-    RepeatConfiguration.WEEKLY: 7,
-    RepeatConfiguration.FORTNIGHTLY: 14
-}
-
 
 class CalendarRoute(Route):
     """
     Route for fetching, creating, updating and deleting calendar events.
     """
-    name = "index"
+    name = "calendar"
     path = "/"
 
     @is_authorized
     async def get(self, request):
-        to_fetch = int(request.query_params.get("limit", 50))
-
-        if to_fetch > 50:
-            to_fetch = 50
+        try:
+            to_fetch = max(min(int(request.query_params.get("limit", 50)), 50), 0)
+
+            if start := request.query_params.get("from"):
+                start = date.fromisoformat(start)
+            else:
+                start = date.today()
+
+            if end := request.query_params.get("to"):
+                end = date.fromisoformat(end)
+            else:
+                end = None
+        except ValueError:
+            return JSONResponse({
+                "status": "error",
+                "message": "Invalid limit or date range"
+            }, status_code=400)
+
+        query = CalendarEvent.query.where(db.or_(
+            CalendarEvent.repeat_configuration != RepeatConfiguration.ONCE,
+            CalendarEvent.first_date >= start
+        ))
+
+        if end is not None:
+            query = query.where(CalendarEvent.first_date <= end)
+
+        calendar_events = await read_bind(written_by(request.state.api_key.key)).all(
+            query.order_by(CalendarEvent.first_date)
+        )
 
         returned_events = []
 
-        calendar_events = await CalendarEvent.query.order_by(
-            CalendarEvent.first_date
-        ).gino.all()
-
-        for event in calendar_events:
+        for day, event in islice(merge_occurrences(calendar_events, start, end), to_fetch):
             event_dict = event.to_dict()
-
-            if event.repeat_configuration is RepeatConfiguration.ONCE:
-                event_dict["date"] = event.first_date
-                returned_events.append(event_dict)
-                continue
-
-            if event.repeat_configuration in DAYS.keys():
-                for i in range(ITERATE_COUNT):
-                    event_dict = event.to_dict()
-                    event_dict["date"] = event.first_date + timedelta(
-                        days=DAYS[event.repeat_configuration] * i
-                    )
-                    returned_events.append(event_dict)
-                continue
-
-            for i in range(ITERATE_COUNT):
-                event_dict = event.to_dict()
-                event_dict["date"] = event.first_date + relativedelta(
-                    months=i
-                )
-                returned_events.append(event_dict)
-
-        returned_events = list(
-            filter(
-                lambda event: event["date"] >= date.today(), returned_events
-            )
-        )
-
-        returned_events = list(sorted(returned_events, key=lambda event: event["date"]))
-
-        returned_events = returned_events[:to_fetch]
-
-        for event in returned_events:
-            event["date"] = event["date"].isoformat()
+            event_dict["date"] = day.isoformat()
+            returned_events.append(event_dict)
 
         return JSONResponse(returned_events)
 
@@ -105,22 +88,23 @@ class CalendarRoute(Route):
             "creator": request.state.api_key.creator
         }
 
-        task = BackgroundTask(
-            send_audit_log,
-            title="New calendar event",
-            body=f"Created by <@{request.state.api_key.creator}>",
-            newline_fields={
-                "Title": data["title"],
-            },
-            inline_fields={
-                "First date": data["first_date"],
-                "Repeat configuration": event_data["repeat_configuration"].value.title()
-            },
-            colour=AuditColour.SUCCESS
-        )
-
-        await CalendarEvent(**event_data).create()
+        async with db.transaction():
+            await CalendarEvent(**event_data).create()
+            await invalidate_ical_feed()
+
+            await send_audit_log(
+                title="New calendar event",
+                body=f"Created by <@{request.state.api_key.creator}>",
+                newline_fields={
+                    "Title": data["title"],
+                },
+                inline_fields={
+                    "First date": data["first_date"],
+                    "Repeat configuration": event_data["repeat_configuration"].value.title()
+                },
+                colour=AuditColour.SUCCESS
+            )
 
         return JSONResponse({
             "status": "okay"
-        }, background=task)
+        })
@@ -1,13 +1,66 @@
+import base64
+import binascii
+import json
+
 from asyncpg.exceptions import UniqueViolationError
-from starlette.background import BackgroundTask
 from starlette.responses import JSONResponse
 
 from admin.audit_logs import AuditColour, send_audit_log
+from admin.database import read_bind, written_by
 from admin.route import Route
-from admin.models import ShortURL
+from admin.models import ShortURL, db
+from admin.redirect_cache import invalidate_short_codes
+from admin.responses import StreamingJSONResponse
 from admin.utils import is_authorized, is_json
 from admin.discord_api import get_user
 
+MAX_PAGE_SIZE = 500
+
+
+def serialize_link(url: ShortURL) -> dict:
+    """
+    Serialize a link for the API.
+    """
+    return {
+        "short_code": url.short_code,
+        "long_url": url.long_url,
+        "notes": url.notes,
+        "creator": str(url.creator),
+        "creation_date": url.creation_date.timestamp(),
+        "clicks": url.clicks
+    }
+
+
+def encode_cursor(url: ShortURL) -> str:
+    """
+    Encode the position after a link as an opaque keyset pagination cursor.
+    """
+    return base64.urlsafe_b64encode(
+        json.dumps([url.clicks, url.short_code]).encode()
+    ).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """
+    Decode a cursor from encode_cursor, raising ValueError if it is invalid.
+    """
+    try:
+        clicks, short_code = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, TypeError, UnicodeError) as e:
+        raise ValueError("Malformed cursor") from e
+
+    if not isinstance(clicks, int) or not isinstance(short_code, str):
+        raise ValueError("Malformed cursor")
+
+    return clicks, short_code
+
+
+def escape_like(value: str) -> str:
+    """
+    Escape the wildcard characters of a LIKE pattern.
+    """
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
 
 class LinkRoute(Route):
     """
@@ -18,27 +71,54 @@ class LinkRoute(Route):
 
     @is_authorized
     async def get(self, request):
-        urls = await ShortURL.query.order_by(ShortURL.clicks.desc()).gino.all()
+        query = ShortURL.query
+
+        if request.query_params.get("mine"):
+            query = query.where(ShortURL.creator == request.state.api_key.creator)
 
-        response = []
+        if search := request.query_params.get("search"):
+            pattern = f"%{escape_like(search)}%"
+            query = query.where(db.or_(
+                ShortURL.short_code.ilike(pattern),
+                ShortURL.long_url.ilike(pattern),
+                ShortURL.notes.ilike(pattern)
+            ))
 
-        for url in urls:
-            if (
-                request.query_params.get("mine")
-                and url.creator != request.state.api_key.creator
-            ):
-                continue
+        try:
+            if cursor := request.query_params.get("cursor"):
+                clicks, short_code = decode_cursor(cursor)
+                query = query.where(
+                    db.tuple_(ShortURL.clicks, ShortURL.short_code)
+                    < db.tuple_(clicks, short_code)
+                )
+
+            limit = request.query_params.get("limit")
+            if limit is not None:
+                limit = min(int(limit), MAX_PAGE_SIZE)
+                if limit < 1:
+                    raise ValueError("limit must be positive")
+        except ValueError:
+            return JSONResponse({
+                "status": "error",
+                "message": "Invalid limit or cursor"
+            }, status_code=400)
 
-            response.append({
-                "short_code": url.short_code,
-                "long_url": url.long_url,
-                "notes": url.notes,
-                "creator": str(url.creator),
-                "creation_date": url.creation_date.timestamp(),
-                "clicks": url.clicks
-            })
+        query = query.order_by(ShortURL.clicks.desc(), ShortURL.short_code.desc())
 
-        return JSONResponse(response)
+        bind = read_bind(written_by(request.state.api_key.key))
+
+        if limit is None:
+            return StreamingJSONResponse(query, serialize_link, bind=bind)
+
+        urls = await bind.all(query.limit(limit + 1))
+
+        headers = {}
+
+        if len(urls) > limit:
+            urls = urls[:limit]
+            headers["X-Next-Cursor"] = encode_cursor(urls[-1])
+
+        return JSONResponse([serialize_link(url) for url in urls], headers=headers)
 
     @is_authorized
     @is_json
@@ -79,7 +159,20 @@ class LinkRoute(Route):
             )
 
         try:
-            await new_url.create()
+            async with db.transaction():
+                await new_url.create()
+                await invalidate_short_codes(new_url.short_code)
+
+                await send_audit_log(
+                    title="New short URL",
+                    body=f"Created by <@{request.state.api_key.creator}>",
+                    newline_fields={
+                        "Short code": data["short_code"],
+                        "Long URL": data["long_url"],
+                        "Notes": data.get("notes", "*No notes*")
+                    },
+                    colour=AuditColour.SUCCESS
+                )
         except UniqueViolationError:
             return JSONResponse(
                 {
@@ -89,23 +182,10 @@ class LinkRoute(Route):
                 status_code=400
             )
 
-        task = BackgroundTask(
-            send_audit_log,
-            title="New short URL",
-            body=f"Created by <@{request.state.api_key.creator}>",
-            newline_fields={
-                "Short code": data["short_code"],
-                "Long URL": data["long_url"],
-                "Notes": data.get("notes", "*No notes*")
-            },
-            colour=AuditColour.SUCCESS
-        )
-
         return JSONResponse(
             {
                 "status": "success"
-            },
-            background=task
+            }
         )
 
     @is_authorized
@@ -121,34 +201,35 @@ class LinkRoute(Route):
                 "message": "Short URL not found"
             }, status_code=404)
 
-        if (
+        if not (
             request.state.api_key.is_admin
             or request.state.api_key.creator == short_url.creator
         ):
-            await short_url.delete()
-        else:
             return JSONResponse({
                 "status": "error",
                 "message": "You are not an administrator "
                            "and you do not own this short URL"
             }, status_code=403)
 
-        task = BackgroundTask(
-            send_audit_log,
-            title="Short URL deleted",
-            body=f"Deleted by <@{request.state.api_key.creator}>",
-            newline_fields={
-                "Short code": short_url.short_code,
-                "Long URL": short_url.long_url,
-                "Original creator": f"<@{short_url.creator}>",
-                "Notes": short_url.notes
-            },
-            colour=AuditColour.ERROR
-        )
+        async with db.transaction():
+            await short_url.delete()
+            await invalidate_short_codes(short_url.short_code)
+
+            await send_audit_log(
+                title="Short URL deleted",
+                body=f"Deleted by <@{request.state.api_key.creator}>",
+                newline_fields={
+                    "Short code": short_url.short_code,
+                    "Long URL": short_url.long_url,
+                    "Original creator": f"<@{short_url.creator}>",
+                    "Notes": short_url.notes
+                },
+                colour=AuditColour.ERROR
+            )
 
         return JSONResponse({
             "status": "success"
-        }, background=task)
+        })
 
     @is_authorized
     @is_json
@@ -187,8 +268,7 @@ class LinkRoute(Route):
                 status_code=400
             )
 
-        task = BackgroundTask(
-            send_audit_log,
+        audit_log = dict(
             title="Short URL updated",
             body=f"Updated by <@{request.state.api_key.creator}>",
             newline_fields={
@@ -205,8 +285,7 @@ class LinkRoute(Route):
                 updates["creator"] = int(data.get("creator", short_url.creator))
 
                 if updates["creator"] != short_url.creator:
-                    task = BackgroundTask(
-                        send_audit_log,
+                    audit_log = dict(
                         title="Short URL transferred",
                         body=f"Transferred by <@{request.state.api_key.creator}>",
                         inline_fields={
@@ -222,8 +301,14 @@ class LinkRoute(Route):
                     "message": "User does not exist"
                 }, status_code=400)
 
+        old_short_code = short_url.short_code
+
         try:
-            await short_url.update(**updates).apply()
+            async with db.transaction():
+                await short_url.update(**updates).apply()
+                await invalidate_short_codes(*{old_short_code, updates["short_code"]})
+
+                await send_audit_log(**audit_log)
         except UniqueViolationError:
             return JSONResponse({
                 "status": "error",
@@ -232,4 +317,4 @@ class LinkRoute(Route):
 
         return JSONResponse({
             "status": "success"
-        }, background=task)
+        })
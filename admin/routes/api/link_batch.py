@@ -0,0 +1,308 @@
+from datetime import datetime
+from typing import List
+
+from asyncpg.exceptions import UniqueViolationError
+from sqlalchemy.dialects.postgresql import ARRAY
+from starlette.responses import JSONResponse
+
+from admin.audit_logs import AuditColour, send_audit_log, summarize_list
+from admin.route import Route
+from admin.models import ShortURL, db
+from admin.redirect_cache import invalidate_short_codes
+from admin.routes.api.link_bulk import IMPORT_LINKS_QUERY, validate_row
+from admin.utils import is_authorized, is_json
+
+MAX_BATCH_OPERATIONS = 500
+
+OPERATIONS = ("create", "patch", "transfer", "delete")
+
+# Patches and transfers are both applied as full rows of new values
+UPDATE_LINKS_QUERY = db.text(
+    "UPDATE short_urls SET "
+    "short_code = changes.short_code, "
+    "long_url = changes.long_url, "
+    "notes = changes.notes, "
+    "creator = changes.creator "
+    "FROM unnest("
+    "CAST(:old_short_codes AS text[]), "
+    "CAST(:short_codes AS text[]), "
+    "CAST(:long_urls AS text[]), "
+    "CAST(:notes AS text[]), "
+    "CAST(:creators AS bigint[])"
+    ") AS changes (old_short_code, short_code, long_url, notes, creator) "
+    "WHERE short_urls.short_code = changes.old_short_code"
+)
+
+
+def is_blank(value) -> bool:
+    return not isinstance(value, str) or value.isspace() or value == ""
+
+
+def short_code_in(short_codes: List[str]):
+    return ShortURL.short_code == db.func.any(
+        db.bindparam("short_codes", short_codes, type_=ARRAY(db.Text))
+    )
+
+
+class LinkBatchRoute(Route):
+    """
+    Route for creating, updating, transferring and deleting many links at once.
+    """
+    name = "link_batch"
+    path = "/link/batch"
+
+    @is_authorized
+    @is_json
+    async def post(self, request):
+        """
+        Apply a list of operations in one transaction, or none of them.
+
+        Operations take the same properties as their single link routes:
+
+            {"op": "create", "short_code": ..., "long_url": ..., "notes": ..., "creator": ...}
+            {"op": "patch", "old_short_code": ..., "short_code": ..., "long_url": ..., "notes": ...}
+            {"op": "transfer", "short_code": ..., "creator": ...}
+            {"op": "delete", "short_code": ...}
+
+        Each short code may only be touched by one operation. Errors are
+        reported by the index of the operation that caused them.
+        """
+        data = await request.json()
+        api_key = request.state.api_key
+
+        operations = data.get("operations") if isinstance(data, dict) else None
+
+        if not isinstance(operations, list) or not operations:
+            return JSONResponse({
+                "status": "error",
+                "message": "Pass a list of operations"
+            }, status_code=400)
+
+        if len(operations) > MAX_BATCH_OPERATIONS:
+            return JSONResponse({
+                "status": "error",
+                "message": f"At most {MAX_BATCH_OPERATIONS} operations can be applied at once"
+            }, status_code=400)
+
+        errors = []
+        # The index of the operation touching each short code
+        claimed = {}
+
+        creates = {}
+        patches = {}
+        transfers = {}
+        deletes = {}
+
+        def claim(index: int, short_code: str) -> bool:
+            if short_code in claimed:
+                errors.append({
+                    "operation": index,
+                    "message": f"{short_code} is already changed by operation {claimed[short_code]}"
+                })
+                return False
+
+            claimed[short_code] = index
+            return True
+
+        for index, operation in enumerate(operations):
+            op = operation.get("op") if isinstance(operation, dict) else None
+
+            if op not in OPERATIONS:
+                errors.append({
+                    "operation": index,
+                    "message": f"op must be one of {', '.join(OPERATIONS)}"
+                })
+            elif op == "create":
+                link, error = validate_row(operation, api_key)
+
+                if link is None:
+                    errors.append({"operation": index, "message": error})
+                elif claim(index, link[0]):
+                    creates[link[0]] = (index, link)
+            elif op == "patch":
+                old_short_code = operation.get("old_short_code")
+                short_code = operation.get("short_code", old_short_code)
+
+                if is_blank(old_short_code) or is_blank(short_code):
+                    errors.append({"operation": index, "message": "Short code cannot be blank"})
+                elif "long_url" in operation and is_blank(operation["long_url"]):
+                    errors.append({"operation": index, "message": "Long URL cannot be blank"})
+                elif "notes" in operation and not isinstance(operation["notes"], str):
+                    errors.append({"operation": index, "message": "Notes must be text"})
+                elif "creator" in operation:
+                    errors.append({"operation": index, "message": "Use a transfer to change the creator"})
+                elif claim(index, old_short_code) and (
+                    short_code == old_short_code or claim(index, short_code)
+                ):
+                    patches[old_short_code] = (index, operation)
+            elif op == "transfer":
+                short_code = operation.get("short_code")
+
+                if not api_key.is_admin:
+                    errors.append({
+                        "operation": index,
+                        "message": "Only administrators can transfer short URLs"
+                    })
+                    continue
+
+                try:
+                    creator = int(operation.get("creator"))
+                except (TypeError, ValueError):
+                    errors.append({"operation": index, "message": "Creator must be a user ID"})
+                    continue
+
+                if is_blank(short_code):
+                    errors.append({"operation": index, "message": "Short code cannot be blank"})
+                elif claim(index, short_code):
+                    transfers[short_code] = (index, creator)
+            else:
+                short_code = operation.get("short_code")
+
+                if is_blank(short_code):
+                    errors.append({"operation": index, "message": "Short code cannot be blank"})
+                elif claim(index, short_code):
+                    deletes[short_code] = index
+
+        if errors:
+            return JSONResponse({
+                "status": "error",
+                "message": "No operations were applied",
+                "errors": errors
+            }, status_code=400)
+
+        try:
+            async with db.transaction() as tx:
+                referenced = [*patches, *transfers, *deletes]
+
+                existing = {
+                    url.short_code: url
+                    for url in await ShortURL.query.where(
+                        short_code_in(referenced)
+                    ).with_for_update().gino.all()
+                }
+
+                for short_code in referenced:
+                    if short_code not in existing:
+                        errors.append({
+                            "operation": claimed[short_code],
+                            "message": f"Short URL {short_code} not found"
+                        })
+
+                for short_code, index in deletes.items():
+                    url = existing.get(short_code)
+
+                    if url and not (api_key.is_admin or api_key.creator == url.creator):
+                        errors.append({
+                            "operation": index,
+                            "message": "You are not an administrator "
+                                       "and you do not own this short URL"
+                        })
+
+                if errors:
+                    tx.raise_rollback()
+
+                if deletes:
+                    await ShortURL.delete.where(short_code_in(list(deletes))).gino.status()
+
+                changes = [
+                    (
+                        old_short_code,
+                        operation.get("short_code", old_short_code),
+                        operation.get("long_url", existing[old_short_code].long_url),
+                        operation.get("notes", existing[old_short_code].notes),
+                        existing[old_short_code].creator
+                    )
+                    for old_short_code, (_index, operation) in patches.items()
+                ] + [
+                    (
+                        short_code,
+                        short_code,
+                        existing[short_code].long_url,
+                        existing[short_code].notes,
+                        creator
+                    )
+                    for short_code, (_index, creator) in transfers.items()
+                ]
+
+                if changes:
+                    old_short_codes, short_codes, long_urls, notes, creators = zip(*changes)
+
+                    await db.status(
+                        UPDATE_LINKS_QUERY,
+                        old_short_codes=list(old_short_codes),
+                        short_codes=list(short_codes),
+                        long_urls=list(long_urls),
+                        notes=list(notes),
+                        creators=list(creators)
+                    )
+
+                if creates:
+                    short_codes, long_urls, creators, notes = zip(
+                        *(link for _index, link in creates.values())
+                    )
+
+                    created = {
+                        row["short_code"]
+                        for row in await db.all(
+                            IMPORT_LINKS_QUERY,
+                            short_codes=list(short_codes),
+                            long_urls=list(long_urls),
+                            creators=list(creators),
+                            notes=list(notes),
+                            creation_date=datetime.utcnow()
+                        )
+                    }
+
+                    for short_code, (index, _link) in creates.items():
+                        if short_code not in created:
+                            errors.append({
+                                "operation": index,
+                                "message": "Short code already exists"
+                            })
+
+                    if errors:
+                        tx.raise_rollback()
+
+                await invalidate_short_codes(*claimed)
+
+                await send_audit_log(
+                    title="Short URLs batch updated",
+                    body=f"Updated by <@{api_key.creator}>",
+                    inline_fields={
+                        "Created": len(creates),
+                        "Updated": len(patches),
+                        "Transferred": len(transfers),
+                        "Deleted": len(deletes)
+                    },
+                    newline_fields={
+                        label: summarize_list(list(short_codes))
+                        for label, short_codes in (
+                            ("Created", creates),
+                            ("Updated", patches),
+                            ("Transferred", transfers),
+                            ("Deleted", deletes)
+                        )
+                        if short_codes
+                    },
+                    colour=AuditColour.BLURPLE
+                )
+        except UniqueViolationError:
+            return JSONResponse({
+                "status": "error",
+                "message": "A new short code already exists, no operations were applied"
+            }, status_code=400)
+
+        if errors:
+            return JSONResponse({
+                "status": "error",
+                "message": "No operations were applied",
+                "errors": sorted(errors, key=lambda error: error["operation"])
+            }, status_code=400)
+
+        return JSONResponse({
+            "status": "success",
+            "created": len(creates),
+            "updated": len(patches),
+            "transferred": len(transfers),
+            "deleted": len(deletes)
+        })
@@ -0,0 +1,273 @@
+import csv
+import io
+import json
+from datetime import datetime
+from itertools import islice
+from typing import List, Optional, Tuple
+
+from starlette.responses import JSONResponse
+
+from admin.audit_logs import AuditColour, send_audit_log, summarize_list
+from admin.route import Route
+from admin.models import ShortURL, db
+from admin.redirect_cache import invalidate_short_codes
+from admin.responses import StreamingCSVResponse, StreamingNDJSONResponse
+from admin.routes.api.link import serialize_link
+from admin.utils import is_authorized
+
+MAX_IMPORT_ROWS = 10000
+
+# Comfortably more than MAX_IMPORT_ROWS links with long URLs and notes
+MAX_IMPORT_BYTES = 16 * 1024 * 1024
+
+NDJSON_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl"}
+
+EXPORT_FIELDS = ["short_code", "long_url", "notes", "creator", "creation_date", "clicks"]
+
+# Links that already exist are skipped rather than failing the whole import
+IMPORT_LINKS_QUERY = db.text(
+    "INSERT INTO short_urls (short_code, long_url, creator, notes, creation_date, clicks) "
+    "SELECT imported.short_code, imported.long_url, imported.creator, imported.notes, "
+    ":creation_date, 0 "
+    "FROM unnest("
+    "CAST(:short_codes AS text[]), "
+    "CAST(:long_urls AS text[]), "
+    "CAST(:creators AS bigint[]), "
+    "CAST(:notes AS text[])"
+    ") AS imported (short_code, long_url, creator, notes) "
+    "ON CONFLICT (short_code) DO NOTHING "
+    "RETURNING short_code"
+)
+
+
+async def read_body(request, max_bytes: int) -> Optional[bytes]:
+    """
+    Read a request body, or return None as soon as it is over max_bytes.
+    """
+    try:
+        if int(request.headers.get("Content-Length", 0)) > max_bytes:
+            return None
+    except ValueError:
+        pass
+
+    body = bytearray()
+
+    async for chunk in request.stream():
+        body += chunk
+
+        if len(body) > max_bytes:
+            return None
+
+    return bytes(body)
+
+
+def parse_rows(body: bytes, content_type: str, max_rows: int) -> List[dict]:
+    """
+    Parse up to max_rows rows of an import body, raising ValueError if it is
+    malformed.
+    """
+    text = io.StringIO(body.decode("utf-8-sig"))
+
+    if content_type == "text/csv":
+        return list(islice(csv.DictReader(text), max_rows))
+
+    rows = []
+
+    for line in text:
+        if len(rows) == max_rows:
+            break
+
+        if line.strip():
+            rows.append(json.loads(line))
+
+    return rows
+
+
+def validate_row(row, api_key) -> Tuple[Optional[tuple], Optional[str]]:
+    """
+    Validate a row the way LinkRoute.post validates a single link.
+
+    Returns the values to insert, or the reason the row was rejected.
+    """
+    if not isinstance(row, dict):
+        return None, "Row is not an object"
+
+    short_code = row.get("short_code")
+    long_url = row.get("long_url")
+    notes = row.get("notes") or ""
+
+    if not isinstance(short_code, str) or short_code.isspace() or short_code == "":
+        return None, "Short code cannot be blank"
+
+    if not isinstance(long_url, str) or long_url.isspace() or long_url == "":
+        return None, "Long URL cannot be blank"
+
+    if not isinstance(notes, str):
+        return None, "Notes must be text"
+
+    creator = api_key.creator
+
+    if api_key.is_admin and row.get("creator"):
+        try:
+            creator = int(row["creator"])
+        except (TypeError, ValueError):
+            return None, "Creator must be a user ID"
+
+    # Keys that aren't registered to a user have to say who the link is for
+    if creator is None:
+        return None, "Creator must be given for keys without a user"
+
+    return (short_code, long_url, creator, notes), None
+
+
+class LinkImportRoute(Route):
+    """
+    Route for creating many links at once from NDJSON or CSV.
+    """
+    name = "link_import"
+    path = "/link/import"
+
+    @is_authorized
+    async def post(self, request):
+        """
+        Create every valid link of the body in one statement.
+
+        Each row has a short_code, long_url and optionally notes, plus a
+        creator if the key is an administrator's. Rows that are invalid or
+        whose short code is taken are reported back by their position.
+        """
+        content_type = request.headers.get("Content-Type", "").split(";")[0].strip()
+
+        if content_type not in NDJSON_TYPES and content_type != "text/csv":
+            return JSONResponse({
+                "status": "error",
+                "message": "Send links as application/x-ndjson or text/csv"
+            }, status_code=415)
+
+        body = await read_body(request, MAX_IMPORT_BYTES)
+
+        if body is None:
+            return JSONResponse({
+                "status": "error",
+                "message": f"Imports can be at most {MAX_IMPORT_BYTES} bytes"
+            }, status_code=413)
+
+        try:
+            # One row too many is enough to tell that there are too many
+            rows = parse_rows(body, content_type, MAX_IMPORT_ROWS + 1)
+        except (UnicodeDecodeError, ValueError, csv.Error):
+            return JSONResponse({
+                "status": "error",
+                "message": "Malformed import body"
+            }, status_code=400)
+
+        if len(rows) > MAX_IMPORT_ROWS:
+            return JSONResponse({
+                "status": "error",
+                "message": f"At most {MAX_IMPORT_ROWS} links can be imported at once"
+            }, status_code=400)
+
+        api_key = request.state.api_key
+
+        errors = []
+        links = {}
+        positions = {}
+
+        for position, row in enumerate(rows, 1):
+            link, error = validate_row(row, api_key)
+
+            if link is None:
+                errors.append({"row": position, "message": error})
+            elif link[0] in links:
+                errors.append({
+                    "row": position,
+                    "short_code": link[0],
+                    "message": f"Short code already imported by row {positions[link[0]]}"
+                })
+            else:
+                links[link[0]] = link
+                positions[link[0]] = position
+
+        created = []
+
+        if links:
+            short_codes, long_urls, creators, notes = zip(*links.values())
+
+            async with db.transaction():
+                created = [
+                    row["short_code"]
+                    for row in await db.all(
+                        IMPORT_LINKS_QUERY,
+                        short_codes=list(short_codes),
+                        long_urls=list(long_urls),
+                        creators=list(creators),
+                        notes=list(notes),
+                        creation_date=datetime.utcnow()
+                    )
+                ]
+
+                # Forget that any of them didn't exist
+                await invalidate_short_codes(*created)
+
+                if created:
+                    await send_audit_log(
+                        title="Short URLs imported",
+                        body=f"Imported by <@{api_key.creator}>",
+                        inline_fields={
+                            "Created": len(created),
+                            "Skipped": len(rows) - len(created)
+                        },
+                        newline_fields={
+                            "Short codes": summarize_list(created)
+                        },
+                        colour=AuditColour.SUCCESS
+                    )
+
+        for short_code in links.keys() - set(created):
+            errors.append({
+                "row": positions[short_code],
+                "short_code": short_code,
+                "message": "Short code already exists"
+            })
+
+        return JSONResponse({
+            "status": "success",
+            "created": len(created),
+            "errors": sorted(errors, key=lambda error: error["row"])
+        })
+
+
+class LinkExportRoute(Route):
+    """
+    Route for downloading every link as NDJSON or CSV.
+    """
+    name = "link_export"
+    path = "/link/export"
+
+    @is_authorized
+    async def get(self, request):
+        """
+        Stream all links, or only the key's own if mine is passed, ordered by
+        short code. The format is ndjson unless format=csv is passed.
+        """
+        export_format = request.query_params.get("format", "ndjson")
+
+        if export_format not in ("ndjson", "csv"):
+            return JSONResponse({
+                "status": "error",
+                "message": "format must be ndjson or csv"
+            }, status_code=400)
+
+        query = ShortURL.query
+
+        if request.query_params.get("mine"):
+            query = query.where(ShortURL.creator == request.state.api_key.creator)
+
+        query = query.order_by(ShortURL.short_code)
+
+        headers = {"Content-Disposition": f'attachment; filename="links.{export_format}"'}
+
+        if export_format == "csv":
+            return StreamingCSVResponse(query, serialize_link, EXPORT_FIELDS, headers=headers)
+
+        return StreamingNDJSONResponse(query, serialize_link, headers=headers)
@@ -0,0 +1,212 @@
+from datetime import date, datetime, timedelta, timezone
+
+from starlette.responses import JSONResponse
+
+from admin.route import Route
+from admin.models import ClickDimension, ClickStat, db
+from admin.redirect_cache import resolve_short_code
+from admin.utils import is_authorized
+
+GRANULARITIES = ("hour", "day")
+
+DEFAULT_RANGE = timedelta(days=7)
+MAX_RANGE = timedelta(days=366)
+
+DIMENSIONS = ("referrer", "ua_family", "country")
+
+MAX_TOP_VALUES = 100
+
+
+def parse_timestamp(value: str) -> datetime:
+    """
+    Parse an ISO 8601 timestamp into a naive UTC datetime.
+    """
+    timestamp = datetime.fromisoformat(value)
+
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+
+    return timestamp
+
+
+def to_epoch(timestamp: datetime) -> float:
+    return timestamp.replace(tzinfo=timezone.utc).timestamp()
+
+
+class LinkStatsRoute(Route):
+    """
+    Route for fetching the click time series of a link.
+    """
+    name = "link_stats"
+    path = "/link/{short_code:str}/stats"
+
+    @is_authorized
+    async def get(self, request):
+        """
+        Return clicks per hour or day between from and to (ISO 8601, UTC
+        unless an offset is given). Buckets without clicks are omitted.
+        """
+        short_code = request.path_params["short_code"]
+
+        if not await resolve_short_code(short_code):
+            return JSONResponse({
+                "status": "error",
+                "message": "Short URL not found"
+            }, status_code=404)
+
+        granularity = request.query_params.get("granularity", "hour")
+
+        try:
+            if end := request.query_params.get("to"):
+                end = parse_timestamp(end)
+            else:
+                end = datetime.utcnow()
+
+            if start := request.query_params.get("from"):
+                start = parse_timestamp(start)
+            else:
+                start = end - DEFAULT_RANGE
+        except ValueError:
+            return JSONResponse({
+                "status": "error",
+                "message": "from and to must be ISO 8601 timestamps"
+            }, status_code=400)
+
+        if granularity not in GRANULARITIES or not timedelta(0) <= end - start <= MAX_RANGE:
+            return JSONResponse({
+                "status": "error",
+                "message": f"Pick an hour or day granularity and a range of at most {MAX_RANGE.days} days"
+            }, status_code=400)
+
+        if granularity == "hour":
+            bucket = ClickStat.bucket
+        else:
+            # Inlined rather than bound so the GROUP BY matches the SELECT
+            bucket = db.func.date_trunc(db.literal_column("'day'"), ClickStat.bucket)
+
+        series = await db.select([
+            bucket.label("bucket"),
+            db.func.sum(ClickStat.clicks).label("clicks")
+        ]).where(
+            ClickStat.short_code == short_code
+        ).where(
+            ClickStat.bucket.between(start, end)
+        ).group_by(
+            bucket
+        ).order_by(
+            bucket
+        ).gino.all()
+
+        return JSONResponse({
+            "short_code": short_code,
+            "granularity": granularity,
+            "from": to_epoch(start),
+            "to": to_epoch(end),
+            "series": [
+                {"bucket": to_epoch(row["bucket"]), "clicks": int(row["clicks"])}
+                for row in series
+            ],
+            "total": sum(int(row["clicks"]) for row in series)
+        })
+
+
+class LinkDimensionsRoute(Route):
+    """
+    Route for fetching the top referrers, browsers and countries of a link.
+    """
+    name = "link_dimensions"
+    path = "/link/{short_code:str}/dimensions"
+
+    @is_authorized
+    async def get(self, request):
+        """
+        Return the top limit values of each dimension between the from and to
+        dates inclusive, optionally only for a single dimension.
+        """
+        short_code = request.path_params["short_code"]
+
+        if not await resolve_short_code(short_code):
+            return JSONResponse({
+                "status": "error",
+                "message": "Short URL not found"
+            }, status_code=404)
+
+        dimensions = DIMENSIONS
+
+        if dimension := request.query_params.get("dimension"):
+            dimensions = (dimension,)
+
+        try:
+            limit = min(int(request.query_params.get("limit", 10)), MAX_TOP_VALUES)
+
+            if end := request.query_params.get("to"):
+                end = date.fromisoformat(end)
+            else:
+                end = datetime.utcnow().date()
+
+            if start := request.query_params.get("from"):
+                start = date.fromisoformat(start)
+            else:
+                start = end - DEFAULT_RANGE
+        except ValueError:
+            return JSONResponse({
+                "status": "error",
+                "message": "Invalid limit or date range"
+            }, status_code=400)
+
+        if not set(dimensions) <= set(DIMENSIONS) or limit < 1 or start > end:
+            return JSONResponse({
+                "status": "error",
+                "message": f"Pick a dimension out of {', '.join(DIMENSIONS)}, a positive limit and a valid range"
+            }, status_code=400)
+
+        totals = db.select([
+            ClickDimension.dimension,
+            ClickDimension.value,
+            db.func.sum(ClickDimension.clicks).label("clicks")
+        ]).where(
+            ClickDimension.short_code == short_code
+        ).where(
+            ClickDimension.day.between(start, end)
+        ).where(
+            ClickDimension.dimension.in_(dimensions)
+        ).group_by(
+            ClickDimension.dimension,
+            ClickDimension.value
+        ).alias("totals")
+
+        ranked = db.select([
+            totals.c.dimension,
+            totals.c.value,
+            totals.c.clicks,
+            db.func.row_number().over(
+                partition_by=totals.c.dimension,
+                order_by=(totals.c.clicks.desc(), totals.c.value)
+            ).label("rank")
+        ]).alias("ranked")
+
+        rows = await db.select([
+            ranked.c.dimension,
+            ranked.c.value,
+            ranked.c.clicks
+        ]).where(
+            ranked.c.rank <= limit
+        ).order_by(
+            ranked.c.dimension,
+            ranked.c.rank
+        ).gino.all()
+
+        response = {dimension: [] for dimension in dimensions}
+
+        for row in rows:
+            response[row["dimension"]].append({
+                "value": row["value"],
+                "clicks": int(row["clicks"])
+            })
+
+        return JSONResponse({
+            "short_code": short_code,
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "dimensions": response
+        })
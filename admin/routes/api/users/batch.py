@@ -0,0 +1,42 @@
+from starlette.responses import JSONResponse
+
+from admin.route import Route
+from admin.utils import is_authorized
+from admin.discord_api import get_users
+
+MAX_BATCH_SIZE = 100
+
+class UserBatchInformation(Route):
+    """
+    Route for returning the Discord information on many users at once.
+    """
+    name = "user_batch"
+    path = "/batch"
+
+    @is_authorized
+    async def get(self, request):
+        user_ids = {
+            user_id.strip()
+            for user_id in request.query_params.get("ids", "").split(",")
+            if user_id.strip()
+        }
+
+        if not user_ids or not all(user_id.isdigit() for user_id in user_ids):
+            return JSONResponse({
+                "status": "error",
+                "message": "Pass a comma separated list of user IDs as ids"
+            }, status_code=400)
+
+        if len(user_ids) > MAX_BATCH_SIZE:
+            return JSONResponse({
+                "status": "error",
+                "message": f"At most {MAX_BATCH_SIZE} users can be fetched at once"
+            }, status_code=400)
+
+        users, not_found, ratelimited = await get_users(user_ids)
+
+        return JSONResponse({
+            "users": users,
+            "not_found": not_found,
+            "ratelimited": ratelimited
+        })
@@ -12,7 +12,7 @@ class MeAPI(Route):
 
     @is_authorized
     async def get(self, request):
-        key_data = request.state.api_key.__dict__["__values__"]
+        key_data = dict(request.state.api_key.__dict__["__values__"])
         key_data["creator"] = str(key_data["creator"])
 
         return JSONResponse(key_data)
\ No newline at end of file
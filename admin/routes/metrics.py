@@ -0,0 +1,43 @@
+import secrets
+from os import environ
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest
+from prometheus_client.multiprocess import MultiProcessCollector
+from starlette.responses import PlainTextResponse, Response
+
+from admin.route import Route
+from admin.utils import get_api_key
+
+# Scrapers must send this as a bearer token, without it only administrators'
+# API keys can read the metrics
+METRICS_TOKEN = environ.get("METRICS_TOKEN")
+
+
+class MetricsRoute(Route):
+    """
+    Route exposing the application's metrics to Prometheus.
+    """
+    name = "metrics"
+    path = "/metrics"
+
+    async def get(self, request):
+        auth = request.headers.get("Authorization", "")
+
+        if METRICS_TOKEN:
+            authorized = secrets.compare_digest(
+                auth.encode(), f"Bearer {METRICS_TOKEN}".encode()
+            )
+        else:
+            api_key = await get_api_key(auth) if auth else None
+            authorized = api_key is not None and api_key.is_admin
+
+        if not authorized:
+            return PlainTextResponse("Invalid metrics token", status_code=403)
+
+        if "PROMETHEUS_MULTIPROC_DIR" in environ:
+            registry = CollectorRegistry()
+            MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
@@ -1,10 +1,9 @@
 from os import environ
 
-import httpx
-from starlette.background import BackgroundTask
 from starlette.responses import RedirectResponse, PlainTextResponse
 
 from admin.audit_logs import send_audit_log, AuditColour
+from admin.http_client import get_http_client
 from admin.route import Route
 from admin.models import APIKey
 
@@ -42,18 +41,19 @@ class OAuth2Callback(Route):
             "scope": "identify"
         }
 
-        async with httpx.AsyncClient() as client:
-            access_token_resp = await client.post(f"{API_BASE}/oauth2/token", data=data, headers={
-                "Content-Type": "application/x-www-form-urlencoded"
-            })
+        client = get_http_client()
 
-            access_token_resp.raise_for_status()
+        access_token_resp = await client.post(f"{API_BASE}/oauth2/token", data=data, headers={
+            "Content-Type": "application/x-www-form-urlencoded"
+        })
 
-            token = access_token_resp.json()["access_token"]
+        access_token_resp.raise_for_status()
 
-            user_data_resp = await client.get(f"{API_BASE}/users/@me", headers={
-                "Authorization": f"Bearer {token}"
-            })
+        token = access_token_resp.json()["access_token"]
+
+        user_data_resp = await client.get(f"{API_BASE}/users/@me", headers={
+            "Authorization": f"Bearer {token}"
+        })
 
         user_data_resp.raise_for_status()
 
@@ -62,21 +62,19 @@ class OAuth2Callback(Route):
         user_api_key = await APIKey.query.where(APIKey.creator == int(user_data["id"])).gino.first()
 
         if user_api_key:
-            task = BackgroundTask(
-                send_audit_log,
+            await send_audit_log(
                 title="Successful authentication",
                 body=f"Authentication from <@{user_data['id']}>",
                 colour=AuditColour.SUCCESS
             )
-            return RedirectResponse(f"{ADMIN_FRONTEND}#/authorize/{user_api_key.key}", background=task)
+            return RedirectResponse(f"{ADMIN_FRONTEND}#/authorize/{user_api_key.key}")
         else:
-            task = BackgroundTask(
-                send_audit_log,
+            await send_audit_log(
                 title="Failed authentication",
                 body=f"Authentication from <@{user_data['id']}>",
                 colour=AuditColour.ERROR
             )
-            raise PlainTextResponse(
+            return PlainTextResponse(
                 "While you have authenticated with Discord, your account has not yet been approved by the administrator."
                 " Please get in touch with the Modcast tech team to approve your access to the application.",
                 403
@@ -1,9 +1,10 @@
 from starlette.responses import RedirectResponse, PlainTextResponse
 
-from crawlerdetect import CrawlerDetect
-
+from admin.clicks import record_click, record_dimensions
+from admin.crawlers import is_crawler, ua_family
+from admin.dimensions import lookup_country, referrer_host
 from admin.route import Route
-from admin.models import ShortURL
+from admin.redirect_cache import resolve_short_code
 
 class ShortURLRedirect(Route):
     """
@@ -12,22 +13,27 @@ class ShortURLRedirect(Route):
     name = "short_url"
     path = "/{short_code:str}"
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-
-        self.crawler_detector = CrawlerDetect()
-
     async def get(self, request):
         """
         Redirect a short URL to the intended destination.
         """
         short_code = request.path_params["short_code"]
 
-        short_link = await ShortURL.get(short_code)
+        long_url = await resolve_short_code(short_code)
+
+        if long_url:
+            user_agent = request.headers.get("User-Agent", "")
+
+            if not is_crawler(user_agent):
+                record_click(short_code)
+
+            record_dimensions(
+                short_code,
+                referrer=referrer_host(request.headers.get("Referer")),
+                ua_family=ua_family(user_agent),
+                country=lookup_country(request.client.host if request.client else None)
+            )
 
-        if short_link:
-            if not self.crawler_detector.isCrawler(request.headers["User-Agent"]):
-                await short_link.update(clicks=short_link.clicks + 1).apply()
-            return RedirectResponse(short_link.long_url)
+            return RedirectResponse(long_url)
         else:
             return PlainTextResponse("Short code not found", status_code=404)
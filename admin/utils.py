@@ -1,19 +1,75 @@
 from functools import wraps
+from hashlib import sha256
+from os import environ
+from typing import Optional
 
 from starlette.responses import JSONResponse
 
+from admin.cache import MISSING, TTLCache, invalidate, register_cache
 from admin.models import APIKey
 
+# Both caches are keyed by hash_api_key(), so that invalidating a key never
+# sends it to everything listening for invalidations
+API_KEY_CACHE = register_cache("api_keys", TTLCache(
+    maxsize=int(environ.get("API_KEY_CACHE_SIZE", 1024)),
+    ttl=float(environ.get("API_KEY_CACHE_TTL", 300))
+))
+
+# Unknown keys are remembered separately, and for less time than valid ones,
+# so that trying many random keys can't evict the valid ones
+INVALID_API_KEY_CACHE = register_cache("invalid_api_keys", TTLCache(
+    maxsize=int(environ.get("INVALID_API_KEY_CACHE_SIZE", 256)),
+    ttl=float(environ.get("INVALID_API_KEY_CACHE_TTL", 60))
+))
+
 
 class RateLimitException(Exception):
     pass
 
 
+def hash_api_key(key: str) -> str:
+    """
+    Return the SHA-256 hex digest of an API key, as the database triggers do.
+    """
+    return sha256(key.encode()).hexdigest()
+
+
+async def get_api_key(key: str) -> Optional[APIKey]:
+    """
+    Look up an API key, returning None if it does not exist.
+    """
+    key_hash = hash_api_key(key)
+    api_key = API_KEY_CACHE.get(key_hash)
+
+    if api_key is MISSING:
+        if INVALID_API_KEY_CACHE.get(key_hash) is not MISSING:
+            return None
+
+        api_key = await APIKey.get(key)
+
+        if api_key:
+            API_KEY_CACHE.set(key_hash, api_key)
+        else:
+            INVALID_API_KEY_CACHE.set(key_hash, None)
+
+    return api_key
+
+
+async def invalidate_api_keys(*keys: str):
+    """
+    Forget cached lookups of API keys in every worker.
+    """
+    key_hashes = [hash_api_key(key) for key in keys]
+
+    await invalidate("api_keys", *key_hashes)
+    await invalidate("invalid_api_keys", *key_hashes)
+
+
 def is_authorized(f):
     @wraps(f)
     async def check_auth(self, request):
         if auth := request.headers.get("Authorization"):
-            key = await APIKey.get(auth)
+            key = await get_api_key(auth)
             if key:
                 request.state.api_key = key
                 return await f(self, request)
@@ -0,0 +1,66 @@
+"""Notify workers when API keys change
+
+Revision ID: 8d2e6b4f0a13
+Revises: 3f5a9c2d1b7e
+Create Date: 2026-10-18 11:03:17.284611
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d2e6b4f0a13'
+down_revision = '3f5a9c2d1b7e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Keys are also created, revoked and edited by hand in the database, so
+    # rather than relying on the application we let Postgres tell every worker
+    # to drop its cached copy, and any cached lookup of the key as unknown.
+    # Keys are sent hashed as in admin.utils.hash_api_key, since anything able
+    # to LISTEN would see them. See admin.cache for the listening side.
+    op.execute("""
+        CREATE FUNCTION notify_api_key_change() RETURNS trigger AS $$
+        DECLARE
+            keys json;
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                keys := json_build_array(
+                    encode(sha256(convert_to(NEW.key, 'UTF8')), 'hex')
+                );
+            ELSIF TG_OP = 'UPDATE' AND NEW.key IS DISTINCT FROM OLD.key THEN
+                keys := json_build_array(
+                    encode(sha256(convert_to(OLD.key, 'UTF8')), 'hex'),
+                    encode(sha256(convert_to(NEW.key, 'UTF8')), 'hex')
+                );
+            ELSE
+                keys := json_build_array(
+                    encode(sha256(convert_to(OLD.key, 'UTF8')), 'hex')
+                );
+            END IF;
+
+            PERFORM pg_notify(
+                'admin_cache_invalidate',
+                json_build_object('cache', 'api_keys', 'keys', keys)::text
+            );
+            PERFORM pg_notify(
+                'admin_cache_invalidate',
+                json_build_object('cache', 'invalid_api_keys', 'keys', keys)::text
+            );
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER api_keys_notify_change
+        AFTER INSERT OR UPDATE OR DELETE ON api_keys
+        FOR EACH ROW EXECUTE PROCEDURE notify_api_key_change()
+    """)
+
+
+def downgrade():
+    op.execute("DROP TRIGGER api_keys_notify_change ON api_keys")
+    op.execute("DROP FUNCTION notify_api_key_change()")
@@ -0,0 +1,228 @@
+"""
+Benchmark of the admin API's list endpoints at increasing table sizes.
+
+For every size the links, calendar events and API keys tables are seeded
+with that many rows in BENCHMARK_DATABASE_URL, then each case is run in a
+fresh process so that its peak RSS is its own. Latency is measured over a
+number of sequential requests after the first, which is also used to
+measure the size of the response body.
+
+    BENCHMARK_DATABASE_URL=postgresql://localhost/modpod_bench python -m benchmarks.api --json api.json
+"""
+
+import argparse
+import asyncio
+import json
+import resource
+import subprocess
+import sys
+from datetime import date, datetime, timedelta
+from itertools import cycle
+from time import perf_counter
+from typing import Callable, Dict, NamedTuple
+
+from benchmarks.harness import (
+    SEED_PREFIX, QueryCounter, percentile, print_table, running_app, write_results
+)
+
+ADMIN_KEY = f"{SEED_PREFIX}admin"
+
+# Seeded API keys are registered to made up Discord users from here upwards
+CREATOR_BASE = 10 ** 17
+
+SIZES = [1000, 10000, 100000]
+
+
+class Case(NamedTuple):
+    path: str
+    # Run before every request, to benchmark a cold cache for instance
+    before_request: Callable[[], None] = lambda: None
+
+
+def _clear_ical_cache():
+    from admin.calendar import ICAL_CACHE
+
+    ICAL_CACHE.clear()
+
+
+CASES: Dict[str, Case] = {
+    "links": Case("/api/link"),
+    "links_page": Case("/api/link?limit=100"),
+    "calendar": Case("/api/calendar/"),
+    "ical": Case(f"/api/calendar/ical?token={ADMIN_KEY}", _clear_ical_cache),
+    "ical_cached": Case(f"/api/calendar/ical?token={ADMIN_KEY}"),
+    "admin_users": Case("/api/admin/users"),
+}
+
+
+async def delete_rows():
+    from admin.models import APIKey, CalendarEvent, ShortURL
+
+    await ShortURL.delete.where(ShortURL.short_code.startswith(SEED_PREFIX)).gino.status()
+    await CalendarEvent.delete.where(CalendarEvent.id.startswith(SEED_PREFIX)).gino.status()
+    await APIKey.delete.where(APIKey.key.startswith(SEED_PREFIX)).gino.status()
+
+
+async def seed_rows(rows: int):
+    """
+    Replace any previously seeded rows with rows of each table.
+    """
+    from admin.models import RepeatConfiguration, db
+
+    await delete_rows()
+
+    now = datetime.utcnow()
+    today = date.today()
+    repeats = cycle(RepeatConfiguration)
+
+    async with db.acquire() as conn:
+        raw_conn = conn.raw_connection
+
+        await raw_conn.copy_records_to_table(
+            "short_urls",
+            columns=["short_code", "long_url", "creator", "creation_date", "notes", "clicks"],
+            records=(
+                (
+                    f"{SEED_PREFIX}{index}",
+                    f"https://example.com/{index}",
+                    CREATOR_BASE + index % 50,
+                    now,
+                    "",
+                    index % 997
+                )
+                for index in range(rows)
+            )
+        )
+
+        await raw_conn.copy_records_to_table(
+            "events",
+            columns=["id", "title", "first_date", "repeat_configuration", "creator"],
+            records=(
+                (
+                    f"{SEED_PREFIX}{index}",
+                    f"Event {index}",
+                    today + timedelta(days=index % 730 - 365),
+                    repeat.name,
+                    CREATOR_BASE
+                )
+                for index, repeat in zip(range(rows), repeats)
+            )
+        )
+
+        await raw_conn.copy_records_to_table(
+            "api_keys",
+            columns=["key", "is_admin", "creator"],
+            records=[
+                (ADMIN_KEY, True, None),
+                *(
+                    (f"{SEED_PREFIX}{index}", index % 20 == 0, CREATOR_BASE + index)
+                    for index in range(rows - 1)
+                )
+            ]
+        )
+
+
+async def measure(case: Case, iterations: int) -> dict:
+    """
+    Run a case against already seeded tables.
+    """
+    async with running_app() as client:
+        headers = {"Authorization": ADMIN_KEY}
+
+        latencies = []
+        payload_bytes = 0
+
+        with QueryCounter().installed() as queries:
+            for _ in range(iterations + 1):
+                case.before_request()
+
+                started = perf_counter()
+                resp = await client.get(case.path, headers=headers)
+                latencies.append((perf_counter() - started) * 1000)
+
+                resp.raise_for_status()
+                payload_bytes = len(resp.content)
+
+    # The first request pays for connecting and warming caches
+    latencies = latencies[1:] or latencies
+
+    return {
+        "p50_ms": percentile(latencies, 50),
+        "p99_ms": percentile(latencies, 99),
+        "payload_bytes": payload_bytes,
+        "queries_per_request": queries.count / (iterations + 1),
+        # Kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+
+async def run_case(name: str, rows: int, iterations: int) -> dict:
+    """
+    Measure a case in its own process.
+    """
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "benchmarks.api",
+        "--measure", name,
+        "--iterations", str(iterations),
+        stdout=subprocess.PIPE
+    )
+
+    stdout, _ = await process.communicate()
+
+    if process.returncode:
+        raise RuntimeError(f"Measuring {name} at {rows} rows failed")
+
+    return {"rows": rows, **json.loads(stdout)}
+
+
+async def run(args) -> dict:
+    results = {}
+
+    async with running_app():
+        try:
+            for rows in args.size:
+                await seed_rows(rows)
+
+                for name in args.case:
+                    results[f"{name}@{rows}"] = await run_case(name, rows, args.iterations)
+        finally:
+            await delete_rows()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--size", type=int, action="append",
+        help="number of rows to seed, may be repeated (default: 1000, 10000 and 100000)"
+    )
+    parser.add_argument(
+        "--case", action="append", choices=CASES,
+        help="case to run, may be repeated (default: all)"
+    )
+    parser.add_argument("--iterations", type=int, default=10, help="measured requests per case")
+    parser.add_argument("--json", metavar="PATH", help="also write the results to PATH")
+    parser.add_argument("--measure", choices=CASES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(asyncio.run(measure(CASES[args.measure], args.iterations))))
+        return
+
+    args.size = args.size or SIZES
+    args.case = args.case or list(CASES)
+
+    results = asyncio.run(run(args))
+
+    print_table(results)
+
+    if args.json:
+        parameters = {
+            key: value for key, value in vars(args).items() if key not in ("json", "measure")
+        }
+        write_results(args.json, "api", parameters, results)
+
+
+if __name__ == "__main__":
+    main()
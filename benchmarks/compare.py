@@ -0,0 +1,120 @@
+"""
+Compare two benchmark results files and flag regressions.
+
+Exits with status 1 if any metric of any case got worse by more than its
+threshold, so it can gate a change against the results of its base commit.
+
+    python -m benchmarks.compare base.json head.json
+"""
+
+import argparse
+import json
+import math
+import sys
+from typing import Dict, NamedTuple
+
+
+class Metric(NamedTuple):
+    higher_is_better: bool
+    # How much worse, as a fraction of the base result, still isn't a regression
+    threshold: float
+
+
+METRICS: Dict[str, Metric] = {
+    "p50_ms": Metric(higher_is_better=False, threshold=0.15),
+    "p99_ms": Metric(higher_is_better=False, threshold=0.25),
+    "throughput_rps": Metric(higher_is_better=True, threshold=0.15),
+    "queries_per_request": Metric(higher_is_better=False, threshold=0.0),
+    "payload_bytes": Metric(higher_is_better=False, threshold=0.01),
+    "peak_rss_mb": Metric(higher_is_better=False, threshold=0.1),
+    "errors": Metric(higher_is_better=False, threshold=0.0),
+}
+
+
+def change(base: float, head: float) -> float:
+    """
+    Return the relative change from base to head.
+    """
+    if base == 0:
+        return 0.0 if head == 0 else math.copysign(math.inf, head)
+
+    return (head - base) / abs(base)
+
+
+def is_regression(metric: Metric, base: float, head: float) -> bool:
+    worse_by = change(base, head)
+
+    if metric.higher_is_better:
+        worse_by = -worse_by
+
+    return worse_by > metric.threshold
+
+
+def parse_threshold(value: str):
+    name, _, threshold = value.partition("=")
+
+    if name not in METRICS:
+        raise argparse.ArgumentTypeError(f"unknown metric {name!r}")
+
+    try:
+        return name, float(threshold)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid threshold {threshold!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("base", help="results of the commit to compare against")
+    parser.add_argument("head", help="results of the commit being checked")
+    parser.add_argument(
+        "--threshold", type=parse_threshold, action="append", default=[],
+        metavar="METRIC=FRACTION",
+        help="override how much worse a metric may get, e.g. p99_ms=0.5"
+    )
+    args = parser.parse_args()
+
+    metrics = dict(METRICS)
+    for name, threshold in args.threshold:
+        metrics[name] = metrics[name]._replace(threshold=threshold)
+
+    with open(args.base) as base_file, open(args.head) as head_file:
+        base, head = json.load(base_file), json.load(head_file)
+
+    if base["benchmark"] != head["benchmark"]:
+        sys.exit(f"Can't compare {base['benchmark']} results with {head['benchmark']} results")
+
+    print(f"{base['benchmark']}: {base['commit']} -> {head['commit']}")
+
+    regressions = 0
+
+    for case, head_results in head["cases"].items():
+        if (base_results := base["cases"].get(case)) is None:
+            print(f"{case}: new case")
+            continue
+
+        for name, metric in metrics.items():
+            if name not in head_results or name not in base_results:
+                continue
+
+            base_value, head_value = base_results[name], head_results[name]
+
+            flag = ""
+            if is_regression(metric, base_value, head_value):
+                flag = "  REGRESSION"
+                regressions += 1
+
+            print(
+                f"{case:>24} {name:>20} {base_value:>14.3f} {head_value:>14.3f} "
+                f"{change(base_value, head_value):>+9.1%}{flag}"
+            )
+
+    for case in base["cases"].keys() - head["cases"].keys():
+        print(f"{case}: missing from {args.head}")
+
+    if regressions:
+        print(f"{regressions} regressions")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
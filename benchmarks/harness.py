@@ -0,0 +1,167 @@
+"""
+Shared helpers for benchmarking admin:app in-process.
+
+The app is started through its ASGI lifespan against the database at
+BENCHMARK_DATABASE_URL, never DATABASE_URL, since benchmarks seed and delete
+rows of their own. Import this module before anything from admin so that the
+app is configured for it.
+"""
+
+import asyncio
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime, timezone
+from typing import Dict, List
+
+import httpx
+from gino.dialects.asyncpg import DBAPICursor
+
+BENCHMARK_DATABASE_URL = os.environ.get("BENCHMARK_DATABASE_URL")
+
+# Prefix of every row the benchmarks create, so they can be cleaned up
+SEED_PREFIX = "bench-"
+
+if BENCHMARK_DATABASE_URL:
+    os.environ["DATABASE_URL"] = BENCHMARK_DATABASE_URL
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    # Audit logs would otherwise be posted to Discord
+    os.environ.pop("AUDIT_LOG_WEBHOOK", None)
+
+
+def percentile(samples: List[float], percent: float) -> float:
+    """
+    Return the nearest-rank percentile of a list of samples.
+    """
+    if not samples:
+        return math.nan
+
+    ordered = sorted(samples)
+    return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
+
+
+class QueryCounter:
+    """
+    Counts the statements GINO sends to Postgres while installed.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    @contextmanager
+    def installed(self):
+        async_execute = DBAPICursor.async_execute
+        prepare = DBAPICursor.prepare
+
+        async def counted_async_execute(cursor, *args, **kwargs):
+            self.count += 1
+            return await async_execute(cursor, *args, **kwargs)
+
+        async def counted_prepare(cursor, *args, **kwargs):
+            self.count += 1
+            return await prepare(cursor, *args, **kwargs)
+
+        DBAPICursor.async_execute = counted_async_execute
+        DBAPICursor.prepare = counted_prepare
+
+        try:
+            yield self
+        finally:
+            DBAPICursor.async_execute = async_execute
+            DBAPICursor.prepare = prepare
+
+
+@asynccontextmanager
+async def _lifespan(app):
+    receive_queue = asyncio.Queue()
+    send_queue = asyncio.Queue()
+
+    task = asyncio.create_task(app(
+        {"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}},
+        receive_queue.get,
+        send_queue.put
+    ))
+
+    await receive_queue.put({"type": "lifespan.startup"})
+    message = await send_queue.get()
+
+    if message["type"] != "lifespan.startup.complete":
+        raise RuntimeError(f"Application startup failed: {message.get('message')}")
+
+    try:
+        yield
+    finally:
+        await receive_queue.put({"type": "lifespan.shutdown"})
+        await send_queue.get()
+        await task
+
+
+@asynccontextmanager
+async def running_app(client_host: str = "203.0.113.10"):
+    """
+    Start admin:app and yield an HTTP client that calls it in-process.
+
+    Tables missing from the benchmark database are created first.
+    """
+    if not BENCHMARK_DATABASE_URL:
+        sys.exit("Set BENCHMARK_DATABASE_URL to a scratch Postgres database")
+
+    from admin import app
+    from admin.models import db
+
+    async with _lifespan(app):
+        await db.gino.create_all()
+
+        transport = httpx.ASGITransport(app=app, client=(client_host, 50000))
+
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            yield client
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def write_results(path: str, benchmark: str, parameters: dict, cases: Dict[str, dict]):
+    """
+    Write the results of a benchmark run as JSON.
+    """
+    with open(path, "w") as results_file:
+        json.dump({
+            "benchmark": benchmark,
+            "commit": _git_commit(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "parameters": parameters,
+            "cases": cases
+        }, results_file, indent=2)
+        results_file.write("\n")
+
+
+def print_table(cases: Dict[str, dict]):
+    """
+    Print the results of a benchmark run as an aligned table.
+    """
+    columns = ["case", *next(iter(cases.values()))]
+    rows = [[name, *(_format(value) for value in case.values())] for name, case in cases.items()]
+
+    widths = [max(len(str(cell)) for cell in column) for column in zip(columns, *rows)]
+
+    for row in [columns, *rows]:
+        print("  ".join(str(cell).rjust(width) for cell, width in zip(row, widths)))
+
+
+def _format(value) -> str:
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    return str(value)
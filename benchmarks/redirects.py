@@ -0,0 +1,229 @@
+"""
+Load benchmark of the short URL redirect route.
+
+Seeds links into BENCHMARK_DATABASE_URL and replays requests for them drawn
+from a Zipfian distribution, mixed with misses and with crawler user agents,
+against admin:app in-process. For each scenario it reports latency
+percentiles, throughput and how many queries were sent to Postgres per
+request, including the write-behind click flushes.
+
+    BENCHMARK_DATABASE_URL=postgresql://localhost/modpod_bench python -m benchmarks.redirects
+"""
+
+import argparse
+import asyncio
+import random
+from datetime import datetime
+from itertools import accumulate
+from time import perf_counter
+from typing import List, NamedTuple, Tuple
+
+from benchmarks.harness import (
+    SEED_PREFIX, QueryCounter, percentile, print_table, running_app, write_results
+)
+
+BROWSER_USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (X11; Linux x86_64; rv:120.0) Gecko/20100101 Firefox/120.0",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36 Edg/120.0.0.0",
+]
+
+CRAWLER_USER_AGENTS = [
+    "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+    "Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)",
+    "Twitterbot/1.0",
+    "Mozilla/5.0 (compatible; Discordbot/2.0; +https://discordapp.com)",
+    "curl/8.4.0",
+]
+
+REFERRERS = [None, "https://t.co/", "https://www.youtube.com/", "https://discord.com/channels/1"]
+
+
+class Scenario(NamedTuple):
+    # Share of requests for short codes that don't exist
+    miss_ratio: float
+    # Share of requests made by crawlers rather than browsers
+    crawler_ratio: float
+
+
+SCENARIOS = {
+    "browsers": Scenario(miss_ratio=0.0, crawler_ratio=0.0),
+    "mixed": Scenario(miss_ratio=0.1, crawler_ratio=0.3),
+    "scanners": Scenario(miss_ratio=0.6, crawler_ratio=0.9),
+}
+
+Request = Tuple[str, dict, bool]
+
+
+def seed_codes(links: int) -> List[str]:
+    return [f"{SEED_PREFIX}{index}" for index in range(links)]
+
+
+async def seed_links(links: int):
+    """
+    Replace any previously seeded links with a fresh set.
+    """
+    from admin.models import ShortURL
+
+    await ShortURL.delete.where(ShortURL.short_code.startswith(SEED_PREFIX)).gino.status()
+
+    codes = seed_codes(links)
+
+    for start in range(0, links, 1000):
+        await ShortURL.insert().values([
+            {
+                "short_code": code,
+                "long_url": f"https://example.com/{code}",
+                "creator": 0,
+                "creation_date": datetime.utcnow(),
+                "notes": ""
+            }
+            for code in codes[start:start + 1000]
+        ]).gino.status()
+
+
+async def delete_links():
+    from admin.models import ShortURL
+
+    await ShortURL.delete.where(ShortURL.short_code.startswith(SEED_PREFIX)).gino.status()
+
+
+def plan_requests(
+    scenario: Scenario,
+    links: int,
+    count: int,
+    zipf: float,
+    rng: random.Random
+) -> List[Request]:
+    """
+    Build the requests of a run up front so that every run of a scenario
+    with the same seed replays exactly the same traffic.
+    """
+    codes = seed_codes(links)
+    weights = list(accumulate(1 / rank ** zipf for rank in range(1, links + 1)))
+
+    # Misses repeat a little, like scanners retrying common paths
+    misses = [f"{SEED_PREFIX}missing-{index}" for index in range(links)]
+
+    requests = []
+
+    for code in rng.choices(codes, cum_weights=weights, k=count):
+        is_miss = rng.random() < scenario.miss_ratio
+
+        if is_miss:
+            code = rng.choice(misses)
+
+        if rng.random() < scenario.crawler_ratio:
+            headers = {"User-Agent": rng.choice(CRAWLER_USER_AGENTS)}
+        else:
+            headers = {"User-Agent": rng.choice(BROWSER_USER_AGENTS)}
+
+            if referrer := rng.choice(REFERRERS):
+                headers["Referer"] = referrer
+
+        requests.append((f"/{code}", headers, is_miss))
+
+    return requests
+
+
+async def replay(client, requests: List[Request], concurrency: int) -> Tuple[List[float], int, float]:
+    """
+    Send requests over concurrent workers.
+
+    Returns the latency of every request in milliseconds, how many got an
+    unexpected response and how long the whole replay took in seconds.
+    """
+    latencies = []
+    errors = 0
+    pending = iter(requests)
+
+    async def worker():
+        nonlocal errors
+
+        for path, headers, is_miss in pending:
+            started = perf_counter()
+            resp = await client.get(path, headers=headers)
+            latencies.append((perf_counter() - started) * 1000)
+
+            if resp.status_code != (404 if is_miss else 307):
+                errors += 1
+
+    started = perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    return latencies, errors, perf_counter() - started
+
+
+async def run(args) -> dict:
+    from admin.cache import CACHES
+    from admin.clicks import flush_clicks
+
+    results = {}
+
+    async with running_app() as client:
+        await seed_links(args.links)
+
+        try:
+            for name in args.scenario:
+                rng = random.Random(args.seed)
+                scenario = SCENARIOS[name]
+
+                for cache in CACHES.values():
+                    cache.clear()
+
+                warmup = plan_requests(scenario, args.links, args.warmup, args.zipf, rng)
+                await replay(client, warmup, args.concurrency)
+                await flush_clicks()
+
+                requests = plan_requests(scenario, args.links, args.requests, args.zipf, rng)
+
+                with QueryCounter().installed() as queries:
+                    latencies, errors, elapsed = await replay(client, requests, args.concurrency)
+                    # Count the clicks written behind as part of the run
+                    await flush_clicks()
+
+                results[name] = {
+                    "requests": len(requests),
+                    "errors": errors,
+                    "throughput_rps": len(requests) / elapsed,
+                    "p50_ms": percentile(latencies, 50),
+                    "p99_ms": percentile(latencies, 99),
+                    "queries_per_request": queries.count / len(requests)
+                }
+        finally:
+            await delete_links()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--links", type=int, default=10000, help="number of links to seed")
+    parser.add_argument("--requests", type=int, default=20000, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=2000, help="unmeasured requests before each scenario")
+    # The client shares the event loop with the app, so high concurrency
+    # mostly measures queueing behind it.
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--zipf", type=float, default=1.1, help="exponent of the short code popularity")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--scenario", action="append", choices=SCENARIOS,
+        help="scenario to run, may be repeated (default: all)"
+    )
+    parser.add_argument("--json", metavar="PATH", help="also write the results to PATH")
+    args = parser.parse_args()
+
+    args.scenario = args.scenario or list(SCENARIOS)
+
+    results = asyncio.run(run(args))
+
+    print_table(results)
+
+    if args.json:
+        parameters = {key: value for key, value in vars(args).items() if key != "json"}
+        write_results(args.json, "redirects", parameters, results)
+
+
+if __name__ == "__main__":
+    main()